@@ -0,0 +1,174 @@
+#!/usr/bin/env python
+#
+# benchmark.py -- load test the forum server in its serving modes
+#
+# Starts forum.py once per worker layout, hammers it with concurrent
+# clients for a while and prints the throughput and latency of each
+# layout, so the scaling with threads and processes can be compared.
+#
+# The server uses the forum database as configured in forumdb.py; point it
+# at a scratch copy if the posts matter, as --posts adds some.
+#
+# Usage: python benchmark.py --layouts 1x1 1x8 2x8 4x8 --clients 16
+#
+
+import argparse
+import httplib
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import forumdb
+
+HOST = '127.0.0.1'
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a sorted list."""
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def client(job):
+    """Requests a path over and over until a deadline.
+
+    Args:
+        job: tuple (port, path, deadline)
+
+    Returns a tuple (latencies, errors).
+    """
+    port, path, deadline = job
+    latencies = []
+    errors = 0
+    while time.time() < deadline:
+        start = time.time()
+        try:
+            conn = httplib.HTTPConnection(HOST, port, timeout=30)
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            conn.close()
+            if response.status != 200:
+                errors += 1
+                continue
+        except (httplib.HTTPException, socket.error):
+            errors += 1
+            continue
+        latencies.append(time.time() - start)
+    return latencies, errors
+
+
+def waitForServer(port, timeout=10):
+    """Waits until something accepts connections on port."""
+    deadline = time.time() + timeout
+    while True:
+        try:
+            socket.create_connection((HOST, port), 1).close()
+            return
+        except socket.error:
+            if time.time() > deadline:
+                raise
+            time.sleep(0.05)
+
+
+def run(layout, port, path, clients, idle, duration, pool):
+    """Load tests one worker layout.
+
+    Args:
+        layout: tuple (processes, threads) to start forum.py with
+        port: port to serve on
+        path: path the clients request
+        clients: number of concurrent clients
+        idle: number of connections opened without sending a request, as
+            very slow clients would
+        duration: seconds to run the clients for
+        pool: multiprocessing.Pool with a process per client
+
+    Returns a tuple (requests per second, sorted latencies, errors).
+    """
+    processes, threads = layout
+    server = subprocess.Popen(
+        [sys.executable, 'forum.py', '--port', str(port),
+         '--processes', str(processes), '--threads', str(threads)],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=open(os.devnull, 'w'), stderr=open(os.devnull, 'w'))
+    sockets = []
+    try:
+        waitForServer(port)
+        # Warm the page cache and the connection pools first.
+        client((port, path, time.time() + 0.5))
+        for n in range(idle):
+            sockets.append(socket.create_connection((HOST, port)))
+        deadline = time.time() + duration
+        results = pool.map(client, [(port, path, deadline)] * clients,
+                           chunksize=1)
+    finally:
+        for sock in sockets:
+            sock.close()
+        server.terminate()
+        server.wait()
+    latencies = sorted(t for times, errors in results for t in times)
+    errors = sum(errors for times, errors in results)
+    return len(latencies) / float(duration), latencies, errors
+
+
+def parseLayout(value):
+    """Parses a PROCESSESxTHREADS layout."""
+    processes, threads = value.lower().split('x')
+    return int(processes), int(threads)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Load test the forum server in several layouts.')
+    parser.add_argument('--layouts', type=parseLayout, nargs='+',
+                        default=[(1, 1), (1, 8), (2, 8), (4, 8)],
+                        help='worker layouts to test, as PROCESSESxTHREADS')
+    parser.add_argument('--clients', type=int, default=16,
+                        help='concurrent clients')
+    parser.add_argument('--idle-clients', type=int, default=0,
+                        help='connections held open without a request')
+    parser.add_argument('--duration', type=float, default=5,
+                        help='seconds to load each layout for')
+    parser.add_argument('--path', default='/',
+                        help='path to request')
+    parser.add_argument('--port', type=int, default=8001,
+                        help='port to run the server on')
+    parser.add_argument('--posts', type=int, default=0,
+                        help='posts to add to the forum before starting')
+    args = parser.parse_args()
+
+    for n in range(args.posts):
+        forumdb.AddPost('Benchmark post %d' % n)
+    forumdb.ClosePool()
+
+    print "%d CPUs, %d clients, %d idle, %.0fs per layout, GET %s" % (
+        multiprocessing.cpu_count(), args.clients, args.idle_clients,
+        args.duration, args.path)
+    print "  %9s %8s %9s %9s %9s %9s %7s" % (
+        'processes', 'threads', 'req/s', 'p50 ms', 'p99 ms', 'max ms',
+        'errors')
+    pool = multiprocessing.Pool(args.clients)
+    try:
+        for layout in args.layouts:
+            rate, latencies, errors = run(layout, args.port, args.path,
+                                          args.clients, args.idle_clients,
+                                          args.duration, pool)
+            if not latencies:
+                latencies = [float('nan')]
+            print "  %9d %8d %9.0f %9.2f %9.2f %9.2f %7d" % (
+                layout[0], layout[1], rate,
+                1000 * percentile(latencies, 0.5),
+                1000 * percentile(latencies, 0.99),
+                1000 * latencies[-1], errors)
+            sys.stdout.flush()
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == '__main__':
+    main()
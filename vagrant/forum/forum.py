@@ -6,8 +6,20 @@
 import forumdb
 
 # Other modules used to run a web server.
+import argparse
 import cgi
-from wsgiref.simple_server import make_server
+import collections
+import hashlib
+import os
+import Queue
+import signal
+import sys
+import threading
+import time
+import urllib
+from datetime import datetime
+from email.utils import formatdate, mktime_tz, parsedate_tz
+from wsgiref.simple_server import make_server, WSGIRequestHandler, WSGIServer
 from wsgiref import util
 
 # HTML template for the forum page
@@ -38,23 +50,159 @@ HTML_WRAP = '''\
 </html>
 '''
 
+# The page around the posts, sent before and after them
+HEADER, FOOTER = (HTML_WRAP % '\0').split('\0')
+
 # HTML template for an individual comment
 POST = '''\
     <div class=post><em class=date>%(time)s</em><br>%(content)s</div>
 '''
 
+# HTML template for the link to the next page of posts
+OLDER = '''\
+    <div class=post><a href="/?before=%s">Older posts</a></div>
+'''
+
+## Parse the keyset cursor of a page link.
+def ParseCursor(value):
+    '''Turn a "time,id" cursor from a page link into a (time, id) tuple.
+
+    Raises ValueError if the cursor is malformed.
+    '''
+    stamp, id = value.rsplit(',', 1)
+    for format in ('%Y-%m-%d %H:%M:%S.%f', '%Y-%m-%d %H:%M:%S'):
+        try:
+            return datetime.strptime(stamp, format), int(id)
+        except ValueError:
+            pass
+    raise ValueError('Bad cursor: %r' % value)
+
+## Most pages of posts kept rendered in memory.
+CACHE_SIZE = 100
+
+# Rendered pages by cursor, least recently used first, each a tuple of
+# (generation, html, etag, last modified).
+_pages = collections.OrderedDict()
+_pagesLock = threading.Lock()
+
+## Find a page of posts already rendered.
+def CachedPage(before):
+    '''Return (html, etag, last modified) for the page of posts before a
+    cursor, or None unless it is in the cache and up to date.
+
+    Pages are kept until forumdb.AddPost() makes them stale.
+    '''
+    generation = forumdb.Generation()
+    with _pagesLock:
+        cached = _pages.pop(before, None)
+        if cached is not None:
+            _pages[before] = cached
+            if cached[0] == generation:
+                return cached[1:]
+    return None
+
+## Render a page of posts as it is read from the database.
+def PageChunks(before):
+    '''Yield the page of posts before a cursor in pieces: the header, each
+    post, the link to older posts and the footer.
+    '''
+    yield HEADER
+    size = forumdb.PAGE_SIZE
+    # get posts from database, one more than fits to see if there are more
+    posts = forumdb.GetAllPosts(None if size is None else size + 1, before)
+    try:
+        last = None
+        for count, post in enumerate(posts):
+            if count == size:
+                cursor = '%s,%d' % (last['time'], last['id'])
+                yield OLDER % urllib.quote_plus(cursor)
+            else:
+                yield POST % post
+                last = post
+    finally:
+        posts.close()
+    yield FOOTER
+
+## Send a page of posts while it is rendered, then cache it.
+def StreamPage(before):
+    '''Yield the pieces of PageChunks(), adding the page to the cache once
+    it is complete.
+
+    With PAGE_SIZE None the page holds every post there is; it is not
+    cached, so memory use stays flat.
+    '''
+    generation = forumdb.Generation()
+    keep = forumdb.PAGE_SIZE is not None
+    chunks = []
+    digest = hashlib.md5()
+    pieces = PageChunks(before)
+    try:
+        for chunk in pieces:
+            digest.update(chunk)
+            if keep:
+                chunks.append(chunk)
+            yield chunk
+    finally:
+        pieces.close()
+    if not keep:
+        return
+    etag = '"%s"' % digest.hexdigest()
+    modified = time.time()
+    with _pagesLock:
+        cached = _pages.pop(before, None)
+        if cached is not None and cached[2] == etag:
+            # A new post elsewhere left this page as it was.
+            modified = cached[3]
+        _pages[before] = (generation, ''.join(chunks), etag, modified)
+        while len(_pages) > CACHE_SIZE:
+            _pages.popitem(last=False)
+
+## Check a conditional request against the page it asks for.
+def NotModified(env, etag, modified):
+    '''Return True if the client's copy of the page is still current.'''
+    match = env.get('HTTP_IF_NONE_MATCH')
+    if match is not None:
+        tags = [tag.strip() for tag in match.split(',')]
+        return '*' in tags or etag in tags or 'W/' + etag in tags
+    since = parsedate_tz(env.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if since is not None:
+        return int(modified) <= mktime_tz(since)
+    return False
+
 ## Request handler for main page
 def View(env, resp):
     '''View is the 'main page' of the forum.
 
-    It displays the submission form and the previously posted messages.
+    It displays the submission form and the previously posted messages, a
+    page at a time.  Each page links to the next one with a cursor made of
+    the time and id of its last post.  Pages are streamed as the posts are
+    read the first time, then served from memory with an ETag and
+    Last-Modified so clients can revalidate them for a 304.
     '''
-    # get posts from database
-    posts = forumdb.GetAllPosts()
+    fields = cgi.parse_qs(env.get('QUERY_STRING', ''))
+    before = None
+    if 'before' in fields:
+        try:
+            before = ParseCursor(fields['before'][0])
+        except ValueError:
+            resp('400 Bad Request', [('Content-type', 'text/plain')])
+            return ['Bad Request: unknown page']
+    cached = CachedPage(before)
+    if cached is None:
+        headers = [('Content-type', 'text/html'),
+                   ('Cache-Control', 'no-cache')]
+        resp('200 OK', headers)
+        return StreamPage(before)
+    html, etag, modified = cached
     # send results
-    headers = [('Content-type', 'text/html')]
-    resp('200 OK', headers)
-    return [HTML_WRAP % ''.join(POST % p for p in posts)]
+    headers = [('ETag', etag),
+               ('Last-Modified', formatdate(modified, usegmt=True)),
+               ('Cache-Control', 'no-cache')]
+    if NotModified(env, etag, modified):
+        resp('304 Not Modified', headers)
+        return []
+    resp('200 OK', [('Content-type', 'text/html')] + headers)
+    return [html]
 
 ## Request handler for posting - inserts to database
 def Post(env, resp):
@@ -100,8 +248,94 @@ def Dispatcher(env, resp):
         return ['Not Found: ' + page]
 
 
-# Run this bad server only on localhost!
-httpd = make_server('', 8000, Dispatcher)
-print "Serving HTTP on port 8000..."
-httpd.serve_forever()
+## Default numbers of worker threads and processes, see Serve().
+THREADS = 8
+PROCESSES = 1
+
+## Seconds a client may take to send its request before it is dropped.
+REQUEST_TIMEOUT = 30
+
+## Request handler that gives up on clients too slow to send a request.
+class RequestHandler(WSGIRequestHandler):
+    timeout = REQUEST_TIMEOUT
+
+## WSGI server with a fixed pool of threads handling the requests.
+class PooledWSGIServer(WSGIServer):
+    '''WSGIServer that queues each accepted connection for one of a fixed
+    set of worker threads, so a slow client only holds up its own thread.
+    '''
+
+    def StartWorkers(self, threads):
+        '''Start the worker threads.  Call it in the process serving.'''
+        self.requests = Queue.Queue()
+        for n in range(threads):
+            worker = threading.Thread(target=self.Work)
+            worker.daemon = True
+            worker.start()
+
+    def process_request(self, request, client_address):
+        self.requests.put((request, client_address))
+
+    def Work(self):
+        while True:
+            request, client_address = self.requests.get()
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+## Run the forum server.
+def Serve(port=8000, threads=THREADS, processes=PROCESSES):
+    '''Serve the forum until interrupted.
+
+    Args:
+      port: The TCP port to listen on.
+      threads: Worker threads per process.
+      processes: Worker processes.  With more than one, the listening socket
+        is opened first and the workers are forked to share it, each with
+        its own threads, database connections and page cache.
+    '''
+    httpd = make_server('', port, Dispatcher, server_class=PooledWSGIServer,
+                        handler_class=RequestHandler)
+    print "Serving HTTP on port %d..." % port
+    sys.stdout.flush()
+    if processes <= 1:
+        httpd.StartWorkers(threads)
+        httpd.serve_forever()
+        return
+    children = []
+    for n in range(processes):
+        pid = os.fork()
+        if pid == 0:
+            try:
+                httpd.StartWorkers(threads)
+                httpd.serve_forever()
+            finally:
+                os._exit(0)
+        children.append(pid)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        for pid in children:
+            os.waitpid(pid, 0)
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the DB Forum server.')
+    parser.add_argument('--port', type=int, default=8000,
+                        help='port to listen on')
+    parser.add_argument('--threads', type=int, default=THREADS,
+                        help='worker threads per process')
+    parser.add_argument('--processes', type=int, default=PROCESSES,
+                        help='worker processes sharing the socket')
+    args = parser.parse_args()
+    # Run this bad server only on localhost!
+    Serve(args.port, args.threads, args.processes)
 
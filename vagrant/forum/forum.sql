@@ -3,3 +3,5 @@ CREATE TABLE posts ( content TEXT,
                      time TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                      id SERIAL );
 
+-- The front page reads posts newest first, a page at a time.
+CREATE INDEX posts_time_id ON posts (time DESC, id DESC);
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+#
+# Test cases for forum.py and forumdb.py
+#
+# Requests are sent straight to forum.Dispatcher, without a server.  Every
+# test starts from an empty posts table in the forum database.
+
+import re
+import threading
+from StringIO import StringIO
+from wsgiref import util
+
+import forum
+import forumdb
+
+
+def reset():
+    with forumdb.Connection() as DB:
+        DB.cursor().execute("TRUNCATE posts RESTART IDENTITY")
+        DB.commit()
+    with forum._pagesLock:
+        forum._pages.clear()
+
+
+def request(path='/', query='', body=None, headers=None):
+    '''Send a request to the forum; return (status, headers, body).'''
+    env = {'PATH_INFO': path, 'QUERY_STRING': query}
+    if body is not None:
+        env.update({'REQUEST_METHOD': 'POST',
+                    'CONTENT_LENGTH': str(len(body)),
+                    'wsgi.input': StringIO(body)})
+    env.update(headers or {})
+    util.setup_testing_defaults(env)
+    response = []
+    def start(status, headers):
+        response.extend([status, dict(headers)])
+    result = forum.Dispatcher(env, start)
+    try:
+        page = ''.join(result)
+    finally:
+        if hasattr(result, 'close'):
+            result.close()
+    return response[0], response[1], page
+
+
+def contents(page):
+    '''Return the contents of the posts on a page, top to bottom.'''
+    return re.findall(r'<br>(.*?)</div>', page)
+
+
+def insertPosts(count, stamp='2020-01-01 12:00:00'):
+    '''Add posts all made at the same moment, bypassing AddPost().'''
+    with forumdb.Connection() as DB:
+        c = DB.cursor()
+        for n in range(count):
+            c.execute("INSERT INTO posts (content, time) VALUES (%s, %s)",
+                      ('Post %d' % n, stamp))
+        DB.commit()
+
+
+def testPost():
+    reset()
+    status, headers, page = request('/post', body='content=Hello')
+    if not status.startswith('302') or headers['Location'] != '/':
+        raise ValueError("Posting should redirect to the front page.")
+    request('/post', body='content=%20%20')
+    request('/post', body='content=World')
+    if contents(request()[2]) != ['World', 'Hello']:
+        raise ValueError("Posts should be newest first, without blanks.")
+    if not request('/missing')[0].startswith('404'):
+        raise ValueError("Unknown pages should not be found.")
+    print "1. Posts are saved and listed newest first."
+
+
+def testKeysetPaging():
+    reset()
+    count = 2 * forumdb.PAGE_SIZE + 5
+    insertPosts(count)
+    seen = []
+    query = ''
+    pages = 0
+    while True:
+        status, headers, page = request('/', query)
+        pages += 1
+        seen.extend(contents(page))
+        link = re.search(r'href="/\?before=([^"]*)"', page)
+        if link is None:
+            break
+        query = 'before=' + link.group(1)
+    expected = ['Post %d' % n for n in reversed(range(count))]
+    if pages != 3 or seen != expected:
+        raise ValueError("Paging should show posts made at once exactly once.")
+    if not request('/', 'before=nonsense')[0].startswith('400'):
+        raise ValueError("A malformed cursor should be refused.")
+    print "2. Pages follow a keyset cursor, even through equal timestamps."
+
+
+def testConditionalGet():
+    reset()
+    forumdb.AddPost('Hello')
+    status, headers, first = request()
+    if 'ETag' in headers:
+        raise ValueError("A page streamed as it renders has no ETag yet.")
+    status, headers, page = request()
+    if page != first or 'ETag' not in headers or \
+            'Last-Modified' not in headers:
+        raise ValueError("A cached page should carry its validators.")
+    etag, modified = headers['ETag'], headers['Last-Modified']
+    if request(headers={'HTTP_IF_NONE_MATCH': etag})[0] != '304 Not Modified':
+        raise ValueError("A matching ETag should get a 304.")
+    if request(headers={'HTTP_IF_MODIFIED_SINCE': modified})[0] != \
+            '304 Not Modified':
+        raise ValueError("An unchanged page since the date should get a 304.")
+    if request(headers={'HTTP_IF_NONE_MATCH': '"other"'})[0] != '200 OK':
+        raise ValueError("Another ETag should get the page.")
+    print "3. Cached pages answer conditional GETs with 304."
+
+
+def testInvalidation():
+    reset()
+    forumdb.AddPost('Hello')
+    request()
+    etag = request()[1]['ETag']
+    generation = forumdb.Generation()
+    request('/post', body='content=News')
+    if forumdb.Generation() == generation:
+        raise ValueError("Adding a post should change the generation.")
+    status, headers, page = request(headers={'HTTP_IF_NONE_MATCH': etag})
+    if status != '200 OK' or contents(page) != ['News', 'Hello']:
+        raise ValueError("A new post should make cached pages stale.")
+    if request()[1]['ETag'] == etag:
+        raise ValueError("A changed page should get a new ETag.")
+    print "4. Adding a post invalidates cached pages."
+
+
+def testStreaming():
+    reset()
+    insertPosts(25)
+    size, fetch = forumdb.PAGE_SIZE, forumdb.FETCH_SIZE
+    forumdb.PAGE_SIZE, forumdb.FETCH_SIZE = None, 4
+    try:
+        env = {'PATH_INFO': '/'}
+        util.setup_testing_defaults(env)
+        chunks = forum.Dispatcher(env, lambda status, headers: None)
+        if isinstance(chunks, list) or next(chunks) != forum.HEADER:
+            raise ValueError("Pages should be sent as they are rendered.")
+        rest = ''.join(chunks)
+        if len(contents(rest)) != 25 or 'Older posts' in rest:
+            raise ValueError("Without a page size every post should be sent.")
+        if None in forum._pages:
+            raise ValueError("Unbounded pages should not be cached.")
+        posts = forumdb.GetAllPosts()
+        if next(posts)['content'] != 'Post 24':
+            raise ValueError("Posts should be read lazily, newest first.")
+        posts.close()
+    finally:
+        forumdb.PAGE_SIZE, forumdb.FETCH_SIZE = size, fetch
+    print "5. Pages are streamed from a server-side cursor."
+
+
+def testPoolWaits():
+    reset()
+    insertPosts(2)
+    forumdb.ClosePool()
+    opened = []
+    first = threading.Thread(target=lambda: opened.append(
+        len(list(forumdb.GetAllPosts()))))
+    first.daemon = True
+    first.start()
+    first.join(10)
+    if opened != [2]:
+        raise ValueError("The first request should open the pool.")
+    forumdb.ConfigurePool(1, 2)
+    try:
+        held = [forumdb.GetAllPosts(), forumdb.GetAllPosts()]
+        for posts in held:
+            next(posts)
+        waiting = threading.Thread(target=forumdb.AddPost, args=('Later',))
+        waiting.daemon = True
+        waiting.start()
+        waiting.join(0.2)
+        if not waiting.is_alive():
+            raise ValueError("Requests past the pool size should wait.")
+        held.pop().close()
+        waiting.join(10)
+        if waiting.is_alive():
+            raise ValueError("A returned connection should serve the waiter.")
+        held.pop().close()
+    finally:
+        forumdb.ConfigurePool()
+    if contents(request()[2])[0] != 'Later':
+        raise ValueError("The waiting post should be saved.")
+    print "6. Requests wait for a pooled connection."
+
+
+if __name__ == '__main__':
+    testPost()
+    testKeysetPaging()
+    testConditionalGet()
+    testInvalidation()
+    testStreaming()
+    testPoolWaits()
+    print "Success!  All tests pass!"
@@ -3,18 +3,158 @@
 # 
 
 import psycopg2, bleach
+import psycopg2.pool
+import multiprocessing
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
+## Database the forum keeps its posts in.
+DSN = "dbname=forum"
+
+## Bounds of the connection pool, see ConfigurePool().
+MIN_CONNECTIONS = 5
+MAX_CONNECTIONS = 10
+
+## Seconds a pooled connection may sit idle before it is checked with a
+## round trip on its next use.
+CHECK_AFTER = 30
+
+## Number of posts on a page of the forum; None puts them all on one.
+PAGE_SIZE = 20
+
+## Rows fetched from the server at a time while reading posts.
+FETCH_SIZE = 100
+
+# Shared memory, so worker processes forked by forum.Serve() see each
+# other's posts.
+_generation = multiprocessing.Value('l', 0)
+
+_pool = None
+_slots = None
+_poolLock = threading.Lock()
+_lastUsed = weakref.WeakKeyDictionary()
+
+## Set up the connection pool.
+def ConfigurePool(minconn=MIN_CONNECTIONS, maxconn=MAX_CONNECTIONS, dsn=DSN):
+    '''Create (or replace) the pool of connections shared by all requests.
+
+    Args:
+      minconn: Connections opened up front and kept open between requests;
+        any more are closed again as they are returned.
+      maxconn: Most connections open at once; further requests wait for one.
+      dsn: libpq connection string of the forum database.
+    '''
+    with _poolLock:
+        _OpenPool(minconn, maxconn, dsn)
+
+def _OpenPool(minconn=MIN_CONNECTIONS, maxconn=MAX_CONNECTIONS, dsn=DSN):
+    # Callers hold _poolLock.
+    global _pool, _slots
+    if _pool is not None and not _pool.closed:
+        _pool.closeall()
+    _pool = psycopg2.pool.ThreadedConnectionPool(minconn, maxconn, dsn)
+    _slots = threading.BoundedSemaphore(maxconn)
+
+## Close the connection pool.
+def ClosePool():
+    '''Close every pooled connection; the next request opens a new pool.'''
+    global _pool
+    with _poolLock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+def _Healthy(DB):
+    if DB.closed:
+        return False
+    if time.time() - _lastUsed.get(DB, time.time()) < CHECK_AFTER:
+        return True
+    try:
+        DB.cursor().execute("SELECT 1")
+        DB.rollback()
+        return True
+    except psycopg2.Error:
+        return False
+
+## Borrow a connection from the pool.
+@contextmanager
+def Connection():
+    '''Lend out a pooled connection for one transaction.
+
+    The transaction is rolled back if the block raises; the block commits
+    itself otherwise.  Connections found closed, or failing a check after
+    sitting idle for CHECK_AFTER seconds, are replaced.
+    '''
+    with _poolLock:
+        if _pool is None:
+            _OpenPool()
+        pool, slots = _pool, _slots
+    slots.acquire()
+    try:
+        DB = pool.getconn()
+        while not _Healthy(DB):
+            pool.putconn(DB, close=True)
+            DB = pool.getconn()
+        try:
+            yield DB
+            DB.rollback()
+        except Exception:
+            if not DB.closed:
+                DB.rollback()
+            raise
+        finally:
+            _lastUsed[DB] = time.time()
+            pool.putconn(DB, close=bool(DB.closed))
+    finally:
+        slots.release()
+
+## Tell caches when the posts have changed.
+def Generation():
+    '''Return a number that changes every time a post is added, here or in
+    a process forked from the same parent.
+
+    Anything built from the posts while the number stays the same is still
+    up to date.
+    '''
+    return _generation.value
 
 ## Get posts from database.
-def GetAllPosts():
-    '''Get all the posts from the database, sorted with the newest first.
+def GetAllPosts(limit=None, before=None):
+    '''Get posts from the database, sorted with the newest first.
+
+    Args:
+      limit: The most posts to return; None returns all of them.
+      before: A (time, id) keyset cursor from an earlier page; only posts
+        older than it are returned.
+
+    Each post is a dict with its content, time and id.  The time and id of
+    the last post on a page make the cursor for the next one.
+
+    Posts are read lazily through a server-side cursor, FETCH_SIZE rows at
+    a time, so however many there are only a few are in memory at once.
+    The pooled connection is borrowed on the first post and returned once
+    the posts are used up, or when the generator is closed.
     '''
-    DB = psycopg2.connect("dbname=forum")
-    c = DB.cursor()
-    c.execute("SELECT time, content FROM posts ORDER BY time DESC")
-    posts = ({'content': str(row[1]), 'time': str(row[0])}
-            for row in c.fetchall())
-    DB.close()
-    return posts
+    query = "SELECT time, content, id FROM posts"
+    args = []
+    if before is not None:
+        query += " WHERE (time, id) < (%s, %s)"
+        args.extend(before)
+    query += " ORDER BY time DESC, id DESC"
+    if limit is not None:
+        query += " LIMIT %s"
+        args.append(limit)
+    return _Stream(query, args)
+
+def _Stream(query, args):
+    with Connection() as DB:
+        c = DB.cursor('posts')
+        c.itersize = FETCH_SIZE
+        c.execute(query, args)
+        for row in c:
+            yield {'content': str(row[1]), 'time': str(row[0]), 'id': row[2]}
 
 ## Add a post to the database.
 def AddPost(content):
@@ -23,9 +163,10 @@ def AddPost(content):
     Args:
       content: The text content of the new post.
     '''
-    DB = psycopg2.connect("dbname=forum")
-    c = DB.cursor()
     clean_content = bleach.clean(content)
-    c.execute("INSERT INTO posts (content) VALUES (%s)", (clean_content,))
-    DB.commit()
-    DB.close()
+    with Connection() as DB:
+        c = DB.cursor()
+        c.execute("INSERT INTO posts (content) VALUES (%s)", (clean_content,))
+        DB.commit()
+    with _generation.get_lock():
+        _generation.value += 1
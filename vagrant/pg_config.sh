@@ -1,5 +1,11 @@
+# The tournament schema needs PostgreSQL 11 or later, from the PostgreSQL
+# apt repository; bionic's psycopg2 (2.7) is recent enough.
 apt-get -qqy update
-apt-get -qqy install postgresql python-psycopg2
+apt-get -qqy install wget ca-certificates
+echo "deb http://apt-archive.postgresql.org/pub/repos/apt bionic-pgdg main" > /etc/apt/sources.list.d/pgdg.list
+wget -qO- https://www.postgresql.org/media/keys/ACCC4CF8.asc | apt-key add -
+apt-get -qqy update
+apt-get -qqy install postgresql-11 python-psycopg2 python-numpy
 apt-get -qqy install python-flask python-sqlalchemy
 apt-get -qqy install python-pip
 pip install bleach
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# benchmark.py -- time the tournament module on simulated Swiss events
+#
+# Each run registers the players, then plays Swiss rounds with random
+# results through swissPairings(), reportMatch() and playerStandings(),
+# recording the latency and the number of queries of every call.
+#
+# The tables of the target database are used as is, so point --dsn at a
+# scratch database (created from tournament.sql) rather than a live one.
+#
+# Usage: python benchmark.py --players 64 1024 10000 --rounds 7
+#
+
+import argparse
+import random
+import time
+
+import pairing
+import tournament
+
+
+def totals(operation):
+    """Returns the (queries, roundTrips) tournament.metrics() has so far."""
+    counts = tournament.metrics().get(operation, {})
+    return counts.get('queries', 0), counts.get('roundTrips', 0)
+
+
+class Recorder(object):
+    """Collects latencies, query and round trip counts per operation."""
+
+    def __init__(self):
+        self.times = {}
+        self.queries = {}
+        self.roundTrips = {}
+
+    def call(self, operation, function, *args):
+        """Runs function(*args) and records it under operation."""
+        queries, roundTrips = totals(operation)
+        start = time.time()
+        result = function(*args)
+        elapsed = time.time() - start
+        after = totals(operation)
+        self.times.setdefault(operation, []).append(elapsed)
+        self.queries.setdefault(operation, []).append(after[0] - queries)
+        self.roundTrips.setdefault(operation, []).append(
+            after[1] - roundTrips)
+        return result
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a sorted list."""
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def simulate(players, rounds, mode, drawRate, rng):
+    """Plays one simulated tournament.
+
+    Args:
+        players: number of players to register
+        rounds: number of Swiss rounds to play
+        mode: pairing mode passed to swissPairings()
+        drawRate: chance of a match being a draw
+        rng: random.Random used for results
+
+    Returns a tuple (recorder, roundTimes, total).
+    """
+    recorder = Recorder()
+    start = time.time()
+    tid = tournament.createTournament('Benchmark %d' % players)
+    for n in range(players):
+        recorder.call('registerPlayer', tournament.registerPlayer,
+                      'Player %d' % n, tid)
+    # A freshly loaded database has no planner statistics yet, and
+    # autovacuum takes a while to notice; a live one would have them.
+    with tournament.transaction() as conn:
+        conn.cursor().execute("ANALYZE")
+    roundTimes = []
+    for number in range(rounds):
+        roundStart = time.time()
+        pairs = recorder.call('swissPairings', tournament.swissPairings,
+                              tid, mode)
+        for (id1, name1, id2, name2) in pairs:
+            if rng.random() < drawRate:
+                recorder.call('reportMatch', tournament.reportMatch,
+                              tid, id1, id2, 'TRUE')
+            else:
+                if rng.random() < 0.5:
+                    id1, id2 = id2, id1
+                recorder.call('reportMatch', tournament.reportMatch,
+                              tid, id1, id2)
+        recorder.call('playerStandings', tournament.playerStandings, tid)
+        roundTimes.append(time.time() - roundStart)
+    return recorder, roundTimes, time.time() - start
+
+
+def report(players, rounds, mode, recorder, roundTimes, total):
+    """Prints the results of one simulated tournament."""
+    print
+    print "%d players, %d rounds, %s pairing, prepared statements %s" % (
+        players, rounds, mode,
+        'on' if tournament.PREPARED_STATEMENTS else 'off')
+    print "  %-16s %7s %9s %9s %9s %9s %9s %9s" % (
+        'operation', 'calls', 'p50 ms', 'p90 ms', 'p99 ms', 'max ms',
+        'queries', 'trips')
+    for operation in ('registerPlayer', 'swissPairings', 'reportMatch',
+                      'playerStandings'):
+        times = sorted(recorder.times.get(operation, []))
+        if not times:
+            continue
+        queries = recorder.queries[operation]
+        roundTrips = recorder.roundTrips[operation]
+        print "  %-16s %7d %9.2f %9.2f %9.2f %9.2f %9.1f %9.1f" % (
+            operation, len(times),
+            1000 * percentile(times, 0.5), 1000 * percentile(times, 0.9),
+            1000 * percentile(times, 0.99), 1000 * times[-1],
+            float(sum(queries)) / len(queries),
+            float(sum(roundTrips)) / len(roundTrips))
+    print "  round times (s): %s" % ' '.join('%.3f' % t for t in roundTimes)
+    print "  total: %.3fs" % total
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the tournament module on simulated events.')
+    parser.add_argument('--players', type=int, nargs='+',
+                        default=[64, 256, 1024],
+                        help='field sizes to simulate')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Swiss rounds per tournament')
+    parser.add_argument('--mode', default=pairing.GREEDY,
+                        choices=sorted(pairing.PAIRERS),
+                        help='pairing mode')
+    parser.add_argument('--draw-rate', type=float, default=0.1,
+                        help='chance of a match being drawn')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed for the random results')
+    parser.add_argument('--dsn', default=tournament.DSN,
+                        help='database to run against')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='disable the standings cache')
+    parser.add_argument('--no-prepare', action='store_true',
+                        help='send plain SQL instead of prepared statements')
+    parser.add_argument('--reset', action='store_true',
+                        help='delete all tournament data before starting')
+    args = parser.parse_args()
+
+    tournament.STANDINGS_CACHE = not args.no_cache
+    tournament.PREPARED_STATEMENTS = not args.no_prepare
+    tournament.INSTRUMENT = True
+    tournament.configurePool(dsn=args.dsn)
+    if tournament.STANDINGS_CACHE:
+        # The cache is only used while writes are announced and heard.
+        tournament.STANDINGS_NOTIFY = True
+        tournament.listenForStandings(args.dsn)
+        tournament.standingsListening(10)
+    if args.reset:
+        tournament.resetDatabase()
+
+    rng = random.Random(args.seed)
+    for players in args.players:
+        recorder, roundTimes, total = simulate(
+            players, args.rounds, args.mode, args.draw_rate, rng)
+        report(players, args.rounds, args.mode, recorder, roundTimes, total)
+
+
+if __name__ == '__main__':
+    main()
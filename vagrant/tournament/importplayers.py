@@ -0,0 +1,18 @@
+#!/usr/bin/env python
+#
+# importplayers.py -- register a roster of players from a CSV file
+#
+# Usage: python importplayers.py roster.csv TOURNAMENT_ID
+#
+
+import sys
+
+from tournament import importPlayers
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 3:
+        print "Usage: python importplayers.py roster.csv TOURNAMENT_ID"
+        sys.exit(1)
+    ids = importPlayers(sys.argv[1], int(sys.argv[2]))
+    print "Registered %d players." % len(ids)
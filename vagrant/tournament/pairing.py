@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# pairing.py -- in-memory Swiss pairing engine
+#
+# Nothing in here touches the database.  tournament.py loads standings,
+# opponent history and bye history in bulk and hands them over, so a whole
+# round is paired without any further queries.
+#
+
+import matching
+
+# Pairing modes understood by pairRound().
+GREEDY = 'greedy'
+WEIGHTED = 'weighted'
+
+# How many players further down the standings each player may be paired
+# with in weighted mode.
+WINDOW = 12
+
+
+def playedPairs(matches):
+    """Builds the set of pairs that have already met.
+
+    Args:
+        matches: iterable of (winner, loser) id tuples
+
+    Returns a set of frozensets, one per pair of players that have played.
+    """
+    return set(frozenset((winner, loser)) for winner, loser in matches)
+
+
+def readSnapshot(rows):
+    """Splits a pairing snapshot into the inputs of pairRound().
+
+    Args:
+        rows: standings rows, best first, each followed by a list of the
+            player's opponents, as read by tournament.pairingSnapshot()
+
+    Returns a tuple (ranks, played, byes):
+        ranks: the standings rows without the opponent lists
+        played: set of frozensets of player pairs that already met
+        byes: set of ids of players that already had a bye
+    """
+    ranks = [tuple(row[:-1]) for row in rows]
+    played = set(frozenset((row[0], opponent))
+                 for row in rows for opponent in row[-1])
+    byes = set(row[0] for row in ranks if row[4] > 0)
+    return ranks, played, byes
+
+
+def pickBye(ranks, byes, start=-1):
+    """Chooses who sits out the round when the field is odd.
+
+    Args:
+        ranks: standings rows, best first, with the player id in column 0
+        byes: set of player ids that already had a bye
+        start: index to search up the standings from, negative indexes
+            counting from the end as usual
+
+    Returns the index in ranks of the lowest ranked player from start up
+    without a bye, or -1 (the last player) if everyone has had one.
+    """
+    if start < 0:
+        start += len(ranks)
+    for index in range(start, -1, -1):
+        if ranks[index][0] not in byes:
+            return index
+    return -1
+
+
+def pickOpponent(ranks, played, first=0, start=None):
+    """Finds an opponent for a player.
+
+    Args:
+        ranks: standings rows still to be paired, best first
+        played: set of frozensets of pairs that already met
+        first: index of the player needing an opponent
+        start: index to search down the standings from, first + 1 if None
+
+    Returns the index of the highest ranked player from start down that the
+    player has not met, or first + 1 (a rematch with the next player) if
+    there is none.
+    """
+    player = ranks[first][0]
+    if start is None:
+        start = first + 1
+    for index in range(start, len(ranks)):
+        if frozenset((player, ranks[index][0])) not in played:
+            return index
+    return first + 1
+
+
+def greedyPairs(ranks, played):
+    """Pairs players greedily from the top of the standings down.
+
+    The players still unpaired are kept in a linked list, so each pairing
+    only looks past the opponents the top player already met and the round
+    is paired in time linear in the field for a fixed number of rounds.
+
+    Args:
+        ranks: standings rows to pair, best first, an even number of them
+        played: set of frozensets of pairs that already met
+
+    Returns a list of (id1, name1, id2, name2) tuples.  When the players left
+    at the bottom have all met each other a rematch is accepted.
+    """
+    count = len(ranks)
+    following = list(range(1, count + 1))
+    preceding = list(range(-1, count - 1))
+    pairs = []
+    top = 0
+    while top < count and following[top] < count:
+        player = ranks[top][0]
+        other = following[top]
+        while (other < count and
+               frozenset((player, ranks[other][0])) in played):
+            other = following[other]
+        if other == count:
+            other = following[top]
+        following[preceding[other]] = following[other]
+        if following[other] < count:
+            preceding[following[other]] = preceding[other]
+        player1, player2 = ranks[top], ranks[other]
+        pairs.append((player1[0], player1[1], player2[0], player2[1]))
+        top = following[top]
+    return pairs
+
+
+def weightedPairs(ranks, played, window=WINDOW):
+    """Pairs players by minimum cost perfect matching.
+
+    Every player may meet the next window players in the standings.  A pair
+    costs the square of the score difference, and a rematch costs more than
+    all other pairs of the round together, so rematches only happen when no
+    perfect matching avoids them.  Keeping the graph to a window of the
+    standings keeps it sparse enough to pair thousands of players quickly.
+
+    Args:
+        ranks: standings rows to pair, best first, an even number of them
+        played: set of frozensets of pairs that already met
+        window: how far down the standings a player may be paired
+
+    Returns a list of (id1, name1, id2, name2) tuples, best pairs first.
+    """
+    count = len(ranks)
+    if count < 2:
+        return []
+    candidates = []
+    worst = 0
+    for i in range(count):
+        for j in range(i + 1, min(count, i + 1 + window)):
+            rematch = frozenset((ranks[i][0], ranks[j][0])) in played
+            cost = (ranks[i][2] - ranks[j][2]) ** 2
+            candidates.append((i, j, cost, rematch))
+            worst = max(worst, cost)
+    penalty = worst * (count // 2) + 1
+
+    edges = []
+    for (i, j, cost, rematch) in candidates:
+        if rematch:
+            cost += penalty
+        edges.append((i, j, cost))
+    highest = max(cost for (i, j, cost) in edges)
+    # Maximum weight over perfect matchings is minimum cost; every window
+    # holds the next player, so a perfect matching always exists.
+    mate = matching.maxWeightMatching(
+        [(i, j, highest - cost) for (i, j, cost) in edges], True)
+
+    pairs = []
+    for i in range(count):
+        if mate[i] > i:
+            player1, player2 = ranks[i], ranks[mate[i]]
+            pairs.append((player1[0], player1[1], player2[0], player2[1]))
+    return pairs
+
+
+# Maps each pairing mode to the function that pairs an even field.
+PAIRERS = {GREEDY: greedyPairs,
+           WEIGHTED: weightedPairs}
+
+
+def pairRound(ranks, played, byes, mode=GREEDY):
+    """Pairs a round, setting a player aside for a bye if the field is odd.
+
+    Args:
+        ranks: standings rows as returned by playerStandings()
+        played: set of frozensets of pairs that already met
+        byes: set of player ids that already had a bye
+        mode: GREEDY or WEIGHTED
+
+    Returns a tuple (pairs, bye):
+        pairs: list of (id1, name1, id2, name2) tuples
+        bye: standings row of the player getting a bye, or None
+    """
+    if mode not in PAIRERS:
+        raise ValueError("Unknown pairing mode: %r" % (mode,))
+    ranks = list(ranks)
+    bye = None
+    if len(ranks) % 2 != 0:
+        bye = ranks.pop(pickBye(ranks, byes))
+    return PAIRERS[mode](ranks, played), bye
@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+# ratings.py -- Elo and Glicko player ratings computed from reported matches
+#
+# Ratings follow players across tournaments.  Match history is read in bulk
+# and rated one rating period at a time, a period being one round of one
+# tournament; all games of a period are rated at once with NumPy array
+# operations, from the ratings the players had when the period began.
+#
+# Only closed rounds are rated (see tournament.closeRound()), and each of
+# them once: updateRatings() picks up whatever closed since it last ran.
+# Games of archived tournaments are read from the archive tables, so
+# recomputeRatings() rates them too.
+# Needs NumPy; tournament.py stays importable without it.
+#
+
+import math
+
+import numpy
+import psycopg2.extras
+
+import tournament
+
+# Rating systems understood by rateMatches().
+ELO = 'elo'
+GLICKO = 'glicko'
+
+# Rating and Glicko deviation of a player without any rated games.
+INITIAL_RATING = 1500.0
+INITIAL_DEVIATION = 350.0
+
+# Most an Elo rating moves in one game.
+ELO_K = 32.0
+
+# How much a Glicko deviation grows between two periods a player plays in;
+# enough to take a deviation of 50 back to 350 over a hundred periods.
+GLICKO_C = 34.6
+
+# Key class of the advisory lock serializing updateRatings(), see
+# tournament.lockTournament().  Spells 'rate'.
+LOCK_CLASS = 0x72617465
+
+_Q = math.log(10) / 400
+
+
+def periodBounds(tournaments, rounds):
+    """Finds where each rating period starts in a list of games.
+
+    Args:
+        tournaments: array of the tournament of every game
+        rounds: array of the round of every game, ordered with tournaments
+
+    Returns an array of the offsets where periods start, followed by the
+    number of games.
+    """
+    change = (numpy.diff(tournaments) != 0) | (numpy.diff(rounds) != 0)
+    return numpy.concatenate(([0], numpy.flatnonzero(change) + 1,
+                              [len(tournaments)]))
+
+
+def eloPeriod(rating, winners, losers, scores, k=ELO_K):
+    """Rates one period of games with Elo, updating rating in place.
+
+    Args:
+        rating: array of ratings, indexed by player
+        winners: array of the index of the winner of every game
+        losers: array of the index of the loser of every game
+        scores: array of what every winner scored, 1 or 0.5 for a draw
+        k: most a rating moves in one game
+    """
+    expected = 1.0 / (1.0 + 10.0 ** ((rating[losers] - rating[winners]) / 400))
+    delta = k * (scores - expected)
+    numpy.add.at(rating, winners, delta)
+    numpy.subtract.at(rating, losers, delta)
+
+
+def glickoPeriod(rating, deviation, winners, losers, scores, c=GLICKO_C):
+    """Rates one period of games with Glicko, updating both arrays in place.
+
+    Only the deviations of players in the period grow by c; a period is a
+    single tournament round, so growing everyone's would swamp them.
+
+    Args:
+        rating: array of ratings, indexed by player
+        deviation: array of rating deviations, indexed by player
+        winners: array of the index of the winner of every game
+        losers: array of the index of the loser of every game
+        scores: array of what every winner scored, 1 or 0.5 for a draw
+        c: growth of the deviation since the player's last period
+    """
+    players = numpy.concatenate((winners, losers))
+    opponents = numpy.concatenate((losers, winners))
+    scores = numpy.concatenate((scores, 1.0 - scores))
+    active, index = numpy.unique(players, return_inverse=True)
+    grown = numpy.minimum(numpy.sqrt(deviation[active] ** 2 + c ** 2),
+                          INITIAL_DEVIATION)
+    opponentDeviation = grown[numpy.searchsorted(active, opponents)]
+    g = 1.0 / numpy.sqrt(1.0 + 3 * (_Q * opponentDeviation / math.pi) ** 2)
+    expected = 1.0 / (1.0 + 10.0 ** (
+        -g * (rating[players] - rating[opponents]) / 400))
+    size = len(active)
+    variance = _Q ** 2 * numpy.bincount(
+        index, g ** 2 * expected * (1 - expected), size)
+    gain = numpy.bincount(index, g * (scores - expected), size)
+    precision = 1.0 / grown ** 2 + variance
+    rating[active] += _Q / precision * gain
+    deviation[active] = numpy.sqrt(1.0 / precision)
+
+
+def rateMatches(matches, system=GLICKO, start=None):
+    """Rates a history of games, period by period.
+
+    Args:
+        matches: sequence (or array) of (tournament, round, winner, loser,
+            draw) rows ordered by tournament and round
+        system: ELO or GLICKO
+        start: dict mapping player ids to (rating, deviation, games) to
+            carry on from; other players start unrated
+
+    Returns a dict mapping the id of every player in matches to a tuple
+    (rating, deviation, games).  Elo has no deviation; it is None.
+    """
+    if system not in (ELO, GLICKO):
+        raise ValueError("Unknown rating system: %r" % (system,))
+    games = numpy.asarray(matches, dtype=numpy.int64).reshape(-1, 5)
+    if not len(games):
+        return {}
+    ids, index = numpy.unique(games[:, 2:4], return_inverse=True)
+    index = index.reshape(-1, 2)
+    rating = numpy.full(len(ids), INITIAL_RATING)
+    deviation = numpy.full(len(ids), INITIAL_DEVIATION)
+    played = numpy.bincount(index.ravel(), minlength=len(ids))
+    for i, player in enumerate(ids.tolist()):
+        if start and player in start:
+            previous, spread, count = start[player]
+            rating[i] = previous
+            if spread is not None:
+                deviation[i] = spread
+            played[i] += count
+    scores = numpy.where(games[:, 4] != 0, 0.5, 1.0)
+
+    bounds = periodBounds(games[:, 0], games[:, 1])
+    for begin, end in zip(bounds[:-1], bounds[1:]):
+        winners, losers = index[begin:end, 0], index[begin:end, 1]
+        if system == ELO:
+            eloPeriod(rating, winners, losers, scores[begin:end])
+        else:
+            glickoPeriod(rating, deviation, winners, losers,
+                         scores[begin:end])
+
+    if system == ELO:
+        spreads = [None] * len(ids)
+    else:
+        spreads = deviation.tolist()
+    return dict(zip(ids.tolist(),
+                    zip(rating.tolist(), spreads, played.tolist())))
+
+
+# Games of closed rounds, live or archived, that have not been rated yet, in
+# rating order.
+UNRATED = """SELECT m.tournament, m.round, m.winner, m.loser, m.draw
+             FROM (SELECT m.*
+                   FROM matches AS m
+                   INNER JOIN tournaments AS t ON t.id = m.tournament
+                   WHERE m.round <= t.rounds
+                   UNION ALL
+                   SELECT m.*
+                   FROM matches_archive AS m
+                   INNER JOIN tournaments_archive AS t
+                       ON t.id = m.tournament
+                   WHERE m.round <= t.rounds) AS m
+             WHERE NOT EXISTS (SELECT 1
+                               FROM rated_rounds AS r
+                               WHERE r.system = %s
+                                 AND r.tournament = m.tournament
+                                 AND r.round = m.round)
+             ORDER BY m.tournament, m.round, m.matchid"""
+
+
+def updateRatings(system=GLICKO, conn=None):
+    """Rates every closed round not rated yet.
+
+    Args:
+        system: ELO or GLICKO
+        conn: optional connection to run in, see tournament.transaction()
+
+    Returns the number of games rated.
+    """
+    with tournament.transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))",
+                  (LOCK_CLASS, system))
+        c.execute(UNRATED, (system,))
+        games = numpy.array(c.fetchall(), dtype=numpy.int64).reshape(-1, 5)
+        if not len(games):
+            return 0
+        c.execute("""SELECT player, rating, deviation, games
+                     FROM ratings
+                     WHERE system = %s AND player = ANY(%s)""",
+                  (system, numpy.unique(games[:, 2:4]).tolist()))
+        start = dict((row[0], row[1:]) for row in c.fetchall())
+        rated = rateMatches(games, system, start)
+
+        upsert = """INSERT INTO ratings (system, player, rating, deviation,
+                                         games)
+                    VALUES %s
+                    ON CONFLICT (system, player) DO UPDATE
+                    SET rating = EXCLUDED.rating,
+                        deviation = EXCLUDED.deviation,
+                        games = EXCLUDED.games"""
+        psycopg2.extras.execute_values(
+            c, upsert,
+            [(system, player) + values for player, values in rated.items()],
+            page_size=tournament.BATCH_SIZE)
+        periods = games[periodBounds(games[:, 0], games[:, 1])[:-1], :2]
+        psycopg2.extras.execute_values(
+            c, "INSERT INTO rated_rounds (system, tournament, round) VALUES %s",
+            [(system,) + tuple(period) for period in periods.tolist()],
+            page_size=tournament.BATCH_SIZE)
+    return len(games)
+
+
+def recomputeRatings(system=GLICKO, conn=None):
+    """Throws the ratings away and rates every closed round again.
+
+    Rounds are rated tournament by tournament here, which need not be the
+    order updateRatings() met them in as they closed.
+
+    Args:
+        system: ELO or GLICKO
+        conn: optional connection to run in, see tournament.transaction()
+
+    Returns the number of games rated.
+    """
+    with tournament.transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s))",
+                  (LOCK_CLASS, system))
+        c.execute("DELETE FROM ratings WHERE system = %s", (system,))
+        c.execute("DELETE FROM rated_rounds WHERE system = %s", (system,))
+        return updateRatings(system, DB)
+
+
+def playerRatings(system=GLICKO, conn=None):
+    """Returns the rated players, best first.
+
+    Args:
+        system: ELO or GLICKO
+        conn: optional connection to run in, see tournament.transaction()
+
+    Returns a list of (id, name, rating, deviation, games) tuples.
+    """
+    with tournament.transaction(conn) as DB:
+        c = DB.cursor()
+        sql = """SELECT r.player, p.name, r.rating, r.deviation, r.games
+                 FROM ratings AS r
+                 INNER JOIN players AS p ON p.id = r.player
+                 WHERE r.system = %s
+                 ORDER BY r.rating DESC, r.player"""
+        c.execute(sql, (system,))
+        return c.fetchall()
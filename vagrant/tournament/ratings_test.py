@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+#
+# Test cases for ratings.py
+
+import numpy
+
+from tournament import *
+from ratings import *
+import ratings
+
+
+def reset():
+    resetDatabase(archives=True)
+
+
+def testElo():
+    rating = numpy.array([1500.0, 1500.0, 1600.0, 1400.0])
+    eloPeriod(rating, numpy.array([0, 3]), numpy.array([1, 2]),
+              numpy.array([1.0, 0.5]))
+    if [round(r, 2) for r in rating] != [1516.0, 1484.0, 1591.69, 1408.31]:
+        raise ValueError("Elo should move ratings by K times the surprise.")
+    print "1. Elo rates all games of a period at once."
+
+
+def testGlicko():
+    # The worked example of Glickman's description of the Glicko system.
+    rating = numpy.array([1500.0, 1400.0, 1550.0, 1700.0])
+    deviation = numpy.array([200.0, 30.0, 100.0, 300.0])
+    glickoPeriod(rating, deviation, numpy.array([0, 2, 3]),
+                 numpy.array([1, 0, 0]), numpy.array([1.0, 1.0, 1.0]), c=0)
+    if (round(rating[0], 1), round(deviation[0], 1)) != (1464.1, 151.4):
+        raise ValueError("Glicko should match the published example.")
+    print "2. Glicko matches the published example."
+
+
+def testRateMatches():
+    matches = [(1, 1, 10, 11, False), (1, 1, 12, 13, True),
+               (1, 2, 10, 12, False), (2, 1, 11, 10, False)]
+    elo = rateMatches(matches, ELO)
+    if sorted(elo) != [10, 11, 12, 13] or elo[10][2] != 3:
+        raise ValueError("Every player should be rated with their games.")
+    if elo[13][1] is not None or abs(sum(r for r, d, g in elo.values())
+                                     - 4 * INITIAL_RATING) > 1e-6:
+        raise ValueError("Elo should only move points between players.")
+    steps = rateMatches(matches[:2], GLICKO)
+    steps.update(rateMatches(matches[2:], GLICKO, steps))
+    if steps != rateMatches(matches, GLICKO):
+        raise ValueError("Rating in steps should match rating all at once.")
+    try:
+        rateMatches(matches, 'trueskill')
+    except ValueError:
+        pass
+    else:
+        raise ValueError("An unknown rating system should be refused.")
+    print "3. Histories are rated period by period."
+
+
+def testUpdateRatings():
+    reset()
+    tid = createTournament('Test')
+    [id1, id2, id3, id4] = registerPlayers(["One", "Two", "Three", "Four"], tid)
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id3, id4)
+    if updateRatings() != 0:
+        raise ValueError("Rounds still being played should not be rated.")
+    closeRound(tid)
+    reportMatch(tid, id1, id3)
+    reportMatch(tid, id2, id4, 'TRUE')
+    if updateRatings() != 2:
+        raise ValueError("Closing a round should make it ratable.")
+    closeRound(tid)
+    if updateRatings() != 2 or updateRatings() != 0:
+        raise ValueError("Every round should be rated exactly once.")
+    incremental = playerRatings()
+    if recomputeRatings() != 4 or playerRatings() != incremental:
+        raise ValueError("Recomputing should reproduce incremental ratings.")
+    if [row[0] for row in incremental] != [id1, id3, id2, id4]:
+        raise ValueError("Ratings should follow results.")
+    if [row[4] for row in incremental] != [2, 2, 2, 2]:
+        raise ValueError("Ratings should count the games rated.")
+    print "4. Closed rounds are rated once, incrementally."
+
+
+def testArchiveKeepsRatings():
+    reset()
+    tid = createTournament('Test')
+    [id1, id2, id3] = registerPlayers(["One", "Two", "Three"], tid)
+    reportMatch(tid, id1, id2)
+    closeRound(tid)
+    updateRatings()
+    rated = playerRatings()
+    archiveTournament(tid)
+    if playerRatings() != rated:
+        raise ValueError("Archiving should keep the ratings of its players.")
+    if [row[0] for row in rated] != [id1, id2]:
+        raise ValueError("Only the players who played should be rated.")
+    if updateRatings() != 0:
+        raise ValueError("Archived rounds should stay rated.")
+    if recomputeRatings() != 1 or playerRatings() != rated:
+        raise ValueError("Recomputing should rate archived games again.")
+    if recomputeRatings(ELO) != 1 or len(playerRatings(ELO)) != 2:
+        raise ValueError("Every system should read archived games.")
+    tid = createTournament('Unrated')
+    [id4, id5] = registerPlayers(["Four", "Five"], tid)
+    reportMatch(tid, id4, id5)
+    closeRound(tid)
+    archiveTournament(tid)
+    if updateRatings() != 1:
+        raise ValueError("Rounds archived before rating should be rated.")
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM players ORDER BY id")
+        if c.fetchall() != [(id1,), (id2,), (id4,), (id5,)]:
+            raise ValueError("Rated players should outlive the tournament.")
+    print "5. Archived tournaments stay rated."
+
+
+if __name__ == '__main__':
+    testElo()
+    testGlicko()
+    testRateMatches()
+    testUpdateRatings()
+    testArchiveKeepsRatings()
+    print "Success!  All tests pass!"
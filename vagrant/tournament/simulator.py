@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# simulator.py -- measure Swiss pairing quality without a database
+#
+# Plays thousands of synthetic tournaments in memory through
+# pairing.pairRound(), the code swissPairings() pairs with, spread over a
+# process pool.  Standings are kept and ordered the way tournament.py keeps
+# them, results are drawn from hidden player strengths, and every round is
+# scored for rematches, score floats, bye fairness and pairing time.
+#
+# Usage: python simulator.py --tournaments 2000 --players 64 --rounds 6
+#        python simulator.py --tournaments 8 --players 2000 --rounds 11 \
+#            --mode weighted
+#
+# The second run tracks the pairing time of large fields, which should stay
+# under ROUND_BUDGET seconds a round.
+#
+
+import argparse
+import multiprocessing
+import random
+import time
+
+import pairing
+
+# Points as tournament.py awards them.
+WIN_POINTS = 3
+DRAW_POINTS = 1
+BYE_POINTS = 3
+
+# Spread of the hidden player strengths, in Elo points.
+STRENGTH_SPREAD = 200
+
+# Seconds pairing one round should take at most, even with 2,000 players.
+ROUND_BUDGET = 1.0
+
+
+def standings(players, score, owm, matches, byes):
+    """Returns standings rows ordered like tournament.playerStandings()."""
+    order = sorted(players,
+                   key=lambda p: (-score[p], -owm[p], -matches[p], p))
+    return [(p, 'Player %d' % p, score[p], matches[p], int(p in byes), owm[p])
+            for p in order]
+
+
+def playTournament(job):
+    """Plays one synthetic tournament.
+
+    Args:
+        job: tuple (players, rounds, mode, drawRate, seed)
+
+    Returns a list with one dict of counts per round: pairs, rematches,
+    floats, floatPoints, byes, repeatByes, highByes and seconds.
+    """
+    players, rounds, mode, drawRate, seed = job
+    rng = random.Random(seed)
+    ids = list(range(1, players + 1))
+    strength = dict((p, rng.gauss(0, STRENGTH_SPREAD)) for p in ids)
+    score = dict.fromkeys(ids, 0)
+    owm = dict.fromkeys(ids, 0)
+    matches = dict.fromkeys(ids, 0)
+    opponents = dict((p, set()) for p in ids)
+    played = set()
+    byes = set()
+
+    results = []
+    for number in range(rounds):
+        ranks = standings(ids, score, owm, matches, byes)
+        start = time.time()
+        pairs, bye = pairing.pairRound(ranks, played, byes, mode)
+        seconds = time.time() - start
+
+        stats = dict(pairs=len(pairs), rematches=0, floats=0, floatPoints=0,
+                     byes=0, repeatByes=0, highByes=0, seconds=seconds)
+        if bye is not None:
+            player = bye[0]
+            stats['byes'] = 1
+            if player in byes and len(byes) < players:
+                stats['repeatByes'] = 1
+            lowest = min(score[p] for p in ids if p not in byes or
+                         len(byes) == players)
+            if score[player] > lowest:
+                stats['highByes'] = 1
+            byes.add(player)
+            score[player] += BYE_POINTS
+        for (id1, name1, id2, name2) in pairs:
+            pair = frozenset((id1, id2))
+            if pair in played:
+                stats['rematches'] += 1
+            if score[id1] != score[id2]:
+                stats['floats'] += 1
+                stats['floatPoints'] += abs(score[id1] - score[id2])
+            played.add(pair)
+            opponents[id1].add(id2)
+            opponents[id2].add(id1)
+            matches[id1] += 1
+            matches[id2] += 1
+            if rng.random() < drawRate:
+                score[id1] += DRAW_POINTS
+                score[id2] += DRAW_POINTS
+            else:
+                edge = (strength[id1] - strength[id2]) / 400.0
+                if rng.random() < 1.0 / (1.0 + 10 ** -edge):
+                    score[id1] += WIN_POINTS
+                else:
+                    score[id2] += WIN_POINTS
+        for p in ids:
+            owm[p] = sum(score[o] for o in opponents[p])
+        results.append(stats)
+    return results
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a sorted list."""
+    index = int(round(fraction * (len(values) - 1)))
+    return values[index]
+
+
+def report(players, rounds, mode, tournaments):
+    """Prints per-round pairing quality over all simulated tournaments."""
+    print
+    print "%d tournaments of %d players, %d rounds, %s pairing" % (
+        len(tournaments), players, rounds, mode)
+    print "  %5s %9s %9s %11s %11s %11s %9s %9s" % (
+        'round', 'rematch%', 'float%', 'float pts', 'repeat bye', 'high bye',
+        'p50 ms', 'max ms')
+    for number in range(rounds):
+        stats = [results[number] for results in tournaments]
+        pairs = sum(s['pairs'] for s in stats) or 1
+        byes = sum(s['byes'] for s in stats)
+        floats = sum(s['floats'] for s in stats)
+        times = sorted(s['seconds'] for s in stats)
+        print "  %5d %9.2f %9.2f %11.2f %11s %11s %9.2f %9.2f" % (
+            number + 1,
+            100.0 * sum(s['rematches'] for s in stats) / pairs,
+            100.0 * floats / pairs,
+            float(sum(s['floatPoints'] for s in stats)) / (floats or 1),
+            '%d/%d' % (sum(s['repeatByes'] for s in stats), byes),
+            '%d/%d' % (sum(s['highByes'] for s in stats), byes),
+            1000 * percentile(times, 0.5), 1000 * times[-1])
+    over = sum(1 for results in tournaments for s in results
+               if s['seconds'] > ROUND_BUDGET)
+    if over:
+        print "  %d rounds took over %.1fs to pair" % (over, ROUND_BUDGET)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Measure Swiss pairing quality on simulated events.')
+    parser.add_argument('--tournaments', type=int, default=1000,
+                        help='tournaments to simulate per field size')
+    parser.add_argument('--players', type=int, nargs='+', default=[16, 64],
+                        help='field sizes to simulate')
+    parser.add_argument('--rounds', type=int, default=5,
+                        help='Swiss rounds per tournament')
+    parser.add_argument('--mode', default=pairing.GREEDY,
+                        choices=sorted(pairing.PAIRERS),
+                        help='pairing mode')
+    parser.add_argument('--draw-rate', type=float, default=0.1,
+                        help='chance of a match being drawn')
+    parser.add_argument('--seed', type=int, default=1,
+                        help='seed of the first tournament')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    args = parser.parse_args()
+
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        for players in args.players:
+            jobs = [(players, args.rounds, args.mode, args.draw_rate,
+                     args.seed + n) for n in range(args.tournaments)]
+            tournaments = pool.map(playTournament, jobs,
+                                   chunksize=max(1, len(jobs) // 64))
+            report(players, args.rounds, args.mode, tournaments)
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == '__main__':
+    main()
@@ -3,80 +3,770 @@
 # tournament.py -- implementation of a Swiss-system tournament
 #
 
+import csv
+import functools
+import logging
+import os
+import select
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+
 import psycopg2
+import psycopg2.extensions
+import psycopg2.extras
+import psycopg2.pool
+
+import pairing
+
+DSN = "dbname=tournament"
+
+# Bounds for the module connection pool, see configurePool().
+POOL_MINCONN = 1
+POOL_MAXCONN = 10
+
+_pool = None
+_poolLock = threading.RLock()
+
+# Names of the statements prepared on each connection.
+_prepared = weakref.WeakKeyDictionary()
+_preparedLock = threading.Lock()
+
+# First key of the advisory locks taken by lockTournament(), the second being
+# the tournament id.  ('tour' in ASCII, to stay clear of other lock users.)
+LOCK_CLASS = 0x746f7572
+
+# Run the hot statements through server-side prepared statements, see
+# execute().  Turn off when connecting through a pooler that does not keep
+# sessions, such as pgbouncer in transaction mode.
+PREPARED_STATEMENTS = True
+
+# Rows sent per statement by the bulk helpers.
+BATCH_SIZE = 1000
+
+# playerStandings() serves repeated reads from memory until a write touches
+# the tournament.  With STANDINGS_NOTIFY every write also sends a NOTIFY on
+# STANDINGS_CHANNEL, so processes running listenForStandings() drop their
+# copy too.  Writes from other processes go unnoticed otherwise, so the
+# cache is only used while STANDINGS_NOTIFY is set and the listener is
+# running; every process writing to the database must set it as well.
+STANDINGS_CACHE = True
+STANDINGS_NOTIFY = False
+STANDINGS_CHANNEL = 'standings'
+
+# Seconds the standings listener waits before reconnecting after an error.
+LISTEN_RETRY = 5
+
+# Count queries, round trips, rows and time per public function, see
+# metrics().  Statements taking SLOW_QUERY seconds or more are logged as
+# warnings; None turns that off.
+INSTRUMENT = False
+SLOW_QUERY = None
+
+log = logging.getLogger('tournament')
+
+_local = threading.local()
+_metrics = {}
+_metricsLock = threading.Lock()
+
+_cacheLock = threading.Lock()
+_standings = {}
+_versions = {}
+_epoch = 0
+# Set while the standings listener has its LISTEN in place.
+_listening = threading.Event()
+_listener = None
+_stopListener = None
+# Open transactions that wrote standings: id(connection) -> (weak reference
+# to the connection, set of tournament ids), see trackStandingsWrite().
+_pending = {}
 
 
 def connect():
     """Connect to the PostgreSQL database.  Returns a database connection."""
-    return psycopg2.connect("dbname=tournament")
+    return psycopg2.connect(DSN)
+
+
+class WaitingConnectionPool(psycopg2.pool.ThreadedConnectionPool):
+    """A ThreadedConnectionPool whose getconn() waits for a free connection.
+
+    The plain pool raises PoolError as soon as maxconn connections are out,
+    which fails requests whenever more threads than that are busy at once.
+    """
+
+    def __init__(self, minconn, maxconn, *args, **kwargs):
+        psycopg2.pool.ThreadedConnectionPool.__init__(self, minconn, maxconn,
+                                                      *args, **kwargs)
+        self._slots = threading.BoundedSemaphore(maxconn)
+
+    def getconn(self, key=None):
+        self._slots.acquire()
+        try:
+            return psycopg2.pool.ThreadedConnectionPool.getconn(self, key)
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn=None, key=None, close=False):
+        try:
+            psycopg2.pool.ThreadedConnectionPool.putconn(self, conn, key,
+                                                         close)
+        finally:
+            self._slots.release()
+
+
+def configurePool(minconn=POOL_MINCONN, maxconn=POOL_MAXCONN, dsn=DSN,
+                  **kwargs):
+    """Create (or replace) the module connection pool.
+
+    Args:
+        minconn: connections opened up front and kept open
+        maxconn: most connections the pool will hand out at once; further
+            transactions wait for one to be handed back
+        dsn: libpq connection string for the tournament database
+        kwargs: passed on to psycopg2.connect().  Pass a cursor_factory
+            derived from InstrumentedCursor to keep metrics() working.
+    """
+    global _pool
+    kwargs.setdefault('cursor_factory', InstrumentedCursor)
+    with _poolLock:
+        closePool()
+        _pool = WaitingConnectionPool(minconn, maxconn, dsn, **kwargs)
+        return _pool
+
+
+def closePool():
+    """Close every connection held by the module connection pool."""
+    global _pool
+    with _poolLock:
+        if _pool is not None and not _pool.closed:
+            _pool.closeall()
+        _pool = None
+
+
+def getPool():
+    """Returns the module connection pool, creating it on first use."""
+    pool = _pool
+    if pool is not None and not pool.closed:
+        return pool
+    with _poolLock:
+        if _pool is None or _pool.closed:
+            configurePool()
+        return _pool
+
+
+@contextmanager
+def transaction(conn=None):
+    """Context manager yielding a database connection for one transaction.
+
+    With no argument a connection is borrowed from the pool, committed when
+    the block succeeds, rolled back when it raises and then handed back.
+
+    Args:
+        conn: an already open connection to reuse.  Commit and rollback are
+            then left to the caller, so several tournament functions can be
+            batched into a single transaction.
+    """
+    if conn is not None:
+        yield conn
+        return
+    pool = getPool()
+    DB = pool.getconn()
+    try:
+        yield DB
+        start = time.time()
+        DB.commit()
+        _record('COMMIT', time.time() - start, 0, 0)
+    except Exception:
+        if not DB.closed:
+            DB.rollback()
+        raise
+    finally:
+        settleStandingsWrites(DB)
+        pool.putconn(DB, close=bool(DB.closed))
+
+
+def instrumented(function):
+    """Decorator charging the queries a public function runs to its metrics.
+
+    Work done by a public function called from another one is charged to
+    the outer one.  With INSTRUMENT off the function is called straight.
+    """
+    name = function.__name__
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        if not INSTRUMENT or getattr(_local, 'frame', None) is not None:
+            return function(*args, **kwargs)
+        frame = _local.frame = dict.fromkeys(
+            ('queries', 'roundTrips', 'rows', 'dbSeconds'), 0)
+        _local.name = name
+        start = time.time()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            elapsed = time.time() - start
+            _local.frame = None
+            with _metricsLock:
+                totals = _metrics.get(name)
+                if totals is None:
+                    totals = _metrics[name] = dict.fromkeys(
+                        ('calls', 'seconds') + tuple(frame), 0)
+                totals['calls'] += 1
+                totals['seconds'] += elapsed
+                for key, value in frame.items():
+                    totals[key] += value
+    return wrapper
+
+
+def _record(sql, seconds, queries, rows):
+    # One round trip to the server, running queries statements the caller
+    # asked for (PREPARE and COMMIT are round trips but not queries).
+    frame = getattr(_local, 'frame', None)
+    if frame is not None:
+        frame['roundTrips'] += 1
+        frame['queries'] += queries
+        frame['rows'] += max(rows, 0)
+        frame['dbSeconds'] += seconds
+    if SLOW_QUERY is not None and seconds >= SLOW_QUERY:
+        if isinstance(sql, bytes) and not isinstance(sql, str):
+            sql = sql.decode('utf-8', 'replace')
+        log.warning("slow query (%.3fs) in %s: %s", seconds,
+                    getattr(_local, 'name', None) if frame else None, sql)
+
+
+class InstrumentedCursor(psycopg2.extensions.cursor):
+    """Cursor reporting every statement it runs to metrics().
+
+    The pool hands these out unless configurePool() is given another
+    cursor_factory.  Costs one attribute lookup per statement while neither
+    INSTRUMENT nor SLOW_QUERY is set.
+    """
+
+    def execute(self, sql, args=None):
+        if SLOW_QUERY is None and getattr(_local, 'frame', None) is None:
+            return super(InstrumentedCursor, self).execute(sql, args)
+        start = time.time()
+        try:
+            return super(InstrumentedCursor, self).execute(sql, args)
+        finally:
+            queries = 0 if (isinstance(sql, str) and
+                            sql.startswith('PREPARE ')) else 1
+            _record(sql, time.time() - start, queries, self.rowcount)
+
+    def executemany(self, sql, argslist):
+        if SLOW_QUERY is None and getattr(_local, 'frame', None) is None:
+            return super(InstrumentedCursor, self).executemany(sql, argslist)
+        argslist = list(argslist)
+        start = time.time()
+        try:
+            return super(InstrumentedCursor, self).executemany(sql, argslist)
+        finally:
+            _record(sql, time.time() - start, len(argslist), self.rowcount)
+
+
+def metrics():
+    """Returns the metrics gathered while INSTRUMENT was on.
+
+    Returns a dict mapping public function names to dicts of totals: calls,
+    queries, roundTrips, rows, seconds (wall time of the calls) and
+    dbSeconds (time spent waiting on the server).
+    """
+    with _metricsLock:
+        return dict((name, dict(totals)) for name, totals in _metrics.items())
+
+
+def resetMetrics():
+    """Forgets the metrics gathered so far."""
+    with _metricsLock:
+        _metrics.clear()
+
+
+def lockTournament(c, tid):
+    """Takes the tournament's advisory lock until the transaction ends.
+
+    Every write to a tournament takes it first, so concurrent reports and
+    pairings of one tournament run one after another while other
+    tournaments carry on in parallel.
+
+    Args:
+        c: cursor of the transaction to lock in
+        tid: id of tournament
+    """
+    execute(c, LOCK_TOURNAMENT, (LOCK_CLASS, tid))
+
+
+def standingsVersion(tid):
+    """Returns the current cache version of a tournament's standings."""
+    return (_epoch, _versions.get(tid, 0))
+
+
+def invalidateStandings(tid=None):
+    """Drops the cached standings of a tournament.
+
+    Args:
+        tid: id of tournament, or None to drop every tournament
+    """
+    global _epoch
+    with _cacheLock:
+        if tid is None:
+            _epoch += 1
+            _standings.clear()
+        else:
+            _versions[tid] = _versions.get(tid, 0) + 1
+            _standings.pop(tid, None)
+
+
+def standingsChanged(c, tid=None):
+    """Marks the standings of a tournament as changed by a write.
+
+    Args:
+        c: cursor the write went through
+        tid: id of tournament, or None if every tournament changed
+    """
+    invalidateStandings(tid)
+    trackStandingsWrite(c.connection, tid)
+    if STANDINGS_NOTIFY:
+        payload = '' if tid is None else str(tid)
+        c.execute("SELECT pg_notify(%s, %s)", (STANDINGS_CHANNEL, payload))
+
+
+def trackStandingsWrite(conn, tid=None):
+    """Notes a standings write made in a transaction still open on conn.
+
+    Standings of the tournament are not cached until the transaction ends,
+    as reads from other connections cannot see the write yet.
+
+    Args:
+        conn: psycopg2 connection the write went through
+        tid: id of tournament, or None if every tournament changed
+    """
+    with _cacheLock:
+        entry = _pending.get(id(conn))
+        if entry is None or entry[0]() is not conn:
+            entry = _pending[id(conn)] = (weakref.ref(conn), set())
+        entry[1].add(tid)
+
+
+def settleStandingsWrites(conn):
+    """Drops standings cached while a transaction on conn was open.
+
+    transaction() calls this as its transaction ends; the transactions of
+    connections passed in by callers are settled by pendingStandingsWrite()
+    once it sees them over.
+
+    Args:
+        conn: psycopg2 connection whose transaction has ended
+    """
+    with _cacheLock:
+        entry = _pending.pop(id(conn), None)
+    for tid in entry[1] if entry else ():
+        invalidateStandings(tid)
+
+
+def pendingStandingsWrite(tid):
+    """Returns whether an open transaction has written tid's standings.
+
+    Transactions found over (committed, rolled back, or their connection
+    closed or gone) are settled along the way.
+
+    Args:
+        tid: id of tournament
+    """
+    if not _pending:
+        return False
+    ended = []
+    pending = False
+    with _cacheLock:
+        for key, (ref, tids) in list(_pending.items()):
+            conn = ref()
+            if conn is None or conn.closed or conn.get_transaction_status() \
+                    in (psycopg2.extensions.TRANSACTION_STATUS_IDLE,
+                        psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN):
+                ended.append(_pending.pop(key)[1])
+            elif tid in tids or None in tids:
+                pending = True
+    for tids in ended:
+        for changed in tids:
+            invalidateStandings(changed)
+    return pending
+
+
+def listenForStandings(dsn=DSN):
+    """Starts a daemon thread that applies standings NOTIFYs.
+
+    Other processes writing with STANDINGS_NOTIFY set then invalidate this
+    process's standings cache as soon as they commit.  The cache is used
+    from the moment the listener is in place, see standingsListening().
+
+    Args:
+        dsn: libpq connection string for the tournament database
+
+    Returns the listener thread; a running one is returned as is.
+    """
+    global _listener, _stopListener
+    with _cacheLock:
+        if _listener is not None and _listener.is_alive():
+            return _listener
+        _stopListener = os.pipe()
+        _listener = threading.Thread(target=_listen,
+                                     args=(dsn, _stopListener[0]))
+        _listener.daemon = True
+        _listener.start()
+        return _listener
+
+
+def standingsListening(timeout=None):
+    """Waits for the standings listener to be in place.
+
+    Args:
+        timeout: most seconds to wait, or None to wait as long as it takes
+
+    Returns whether the listener is in place.
+    """
+    return _listening.wait(timeout)
+
+
+def stopListening():
+    """Stops the standings listener, and with it the standings cache."""
+    global _listener, _stopListener
+    with _cacheLock:
+        listener, pipe = _listener, _stopListener
+        _listener = _stopListener = None
+    if listener is None:
+        return
+    os.write(pipe[1], b'x')
+    listener.join()
+    os.close(pipe[0])
+    os.close(pipe[1])
+
+
+def _listen(dsn, stop):
+    while True:
+        DB = None
+        try:
+            DB = psycopg2.connect(dsn)
+            DB.set_isolation_level(
+                psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            c = DB.cursor()
+            c.execute("LISTEN %s" % STANDINGS_CHANNEL)
+            # Anything may have changed while we were not listening.
+            invalidateStandings()
+            _listening.set()
+            while True:
+                ready = select.select([DB, stop], [], [], 60)[0]
+                if stop in ready:
+                    return
+                if not ready:
+                    continue
+                DB.poll()
+                while DB.notifies:
+                    notify = DB.notifies.pop(0)
+                    if notify.payload:
+                        invalidateStandings(int(notify.payload))
+                    else:
+                        invalidateStandings()
+        except psycopg2.Error:
+            _listening.clear()
+            invalidateStandings()
+        finally:
+            _listening.clear()
+            if DB is not None:
+                DB.close()
+        if select.select([stop], [], [], LISTEN_RETRY)[0]:
+            return
+
+
+# Tables emptied by resetDatabase().  Player ids keep counting up, so ids in
+# the archives are never reused.
+LIVE_TABLES = ('players', 'tournaments', 'matches', 'scoreboard',
+               'standings_history', 'ratings', 'rated_rounds')
+ARCHIVE_TABLES = ('tournaments_archive', 'matches_archive',
+                  'scoreboard_archive', 'standings_history_archive')
+
+# Players of a tournament not entered in any other one.  Rated players are
+# kept, as their ratings carry over to later tournaments and would cascade
+# away with them.
+DELETE_TOURNAMENT_PLAYERS = """DELETE FROM players
+                               WHERE id IN (SELECT player
+                                            FROM scoreboard
+                                            WHERE tournament = %s)
+                               AND NOT EXISTS (SELECT 1
+                                               FROM scoreboard AS s
+                                               WHERE s.player = players.id
+                                               AND s.tournament <> %s)
+                               AND NOT EXISTS (SELECT 1
+                                               FROM ratings AS r
+                                               WHERE r.player = players.id)"""
+
+# Archiving also keeps the players of closed rounds, as ratings.py still
+# rates the archived games of those rounds.
+ARCHIVE_TOURNAMENT_PLAYERS = DELETE_TOURNAMENT_PLAYERS + """
+                               AND NOT EXISTS (SELECT 1
+                                               FROM matches AS m
+                                               INNER JOIN tournaments AS t
+                                                   ON t.id = m.tournament
+                                               WHERE m.tournament = %s
+                                               AND m.round <= t.rounds
+                                               AND players.id IN (m.winner,
+                                                                  m.loser))"""
+
+# Statements on the hot paths of reporting, pairing and standings, shared
+# with tournament_async.py.
+LOCK_TOURNAMENT = "SELECT pg_advisory_xact_lock(%s, %s)"
+
+INSERT_PLAYER = "INSERT INTO players (name) VALUES (%s) RETURNING id"
+
+INSERT_SCOREBOARD = "INSERT INTO scoreboard (tournament,player,score,matches,bye) VALUES (%s,%s,%s,%s,%s)"
 
+STANDINGS = """SELECT player, name, score, matches, bye, owm
+               FROM standings
+               WHERE tournament = %s
+               ORDER BY score DESC, owm DESC, matches DESC, player"""
 
-def deleteMatches():
-    """Remove all the match records from the database."""
-    DB = connect()
-    c = DB.cursor()
-    c.execute("DELETE FROM matches")
-    DB.commit()
-    DB.close()
+HAVE_MET = """SELECT EXISTS (SELECT 1
+                             FROM opponents
+                             WHERE tournament = %s
+                             AND player = %s
+                             AND opponent = %s)"""
 
+# A new opponent brings their whole score so far into owm.
+NEW_OPPONENTS = """UPDATE scoreboard AS s SET owm = s.owm + o.score
+                   FROM scoreboard AS o
+                   WHERE s.tournament = %s AND o.tournament = s.tournament
+                   AND ((s.player = %s AND o.player = %s)
+                        OR (s.player = %s AND o.player = %s))"""
 
-def deletePlayers():
-    """Remove all the player records from the database."""
-    DB = connect()
-    c = DB.cursor()
-    c.execute("DELETE FROM players")
-    DB.commit()
-    DB.close()
+# Matches belong to the round after the last closed one.
+INSERT_MATCH = """INSERT INTO matches (tournament, winner, loser, draw, round)
+                  SELECT id, %s, %s, %s, rounds + 1
+                  FROM tournaments
+                  WHERE id = %s"""
 
-def deleteTournaments():
-    """Remove all the tournament records from the database."""
-    DB = connect()
-    c = DB.cursor()
-    c.execute("DELETE FROM tournaments")
-    DB.commit()
-    DB.close()
+ADD_SCORE = "UPDATE scoreboard SET score = score+%s, matches = matches+1 WHERE player = %s AND tournament = %s"
 
+# Credits points to the owm of everyone a player has met, after the player's
+# own score went up by that much.
+OPPONENTS_GAIN = """UPDATE scoreboard SET owm = owm + %s
+                    WHERE tournament = %s
+                    AND player IN (SELECT opponent
+                                   FROM opponents
+                                   WHERE tournament = %s
+                                   AND player = %s)"""
 
-def deleteScoreboard():
+ADD_BYE = "UPDATE scoreboard SET score = score+3, bye=bye+1 WHERE player = %s AND tournament = %s"
+
+HAS_BYE = """SELECT bye
+             FROM scoreboard
+             WHERE player = %s
+             AND tournament = %s"""
+
+VALID_PAIR = """SELECT winner, loser
+                FROM matches
+                WHERE ((winner = %s AND loser = %s)
+                       OR (winner = %s AND loser = %s))
+                AND tournament = %s"""
+
+# Standings plus each player's distinct opponents: everything pairing needs
+# in one round trip.
+PAIRING_SNAPSHOT = """SELECT s.player, s.name, s.score, s.matches, s.bye, s.owm,
+                             COALESCE(o.opponents, '{}')
+                      FROM standings AS s
+                      LEFT JOIN (SELECT player,
+                                        array_agg(opponent) AS opponents
+                                 FROM opponents
+                                 WHERE tournament = %s
+                                 GROUP BY player) AS o
+                          ON o.player = s.player
+                      WHERE s.tournament = %s
+                      ORDER BY s.score DESC, s.owm DESC, s.matches DESC,
+                               s.player"""
+
+# Name each hot statement is prepared under, see execute().
+PREPARED = {LOCK_TOURNAMENT: 'tournament_lock',
+            INSERT_PLAYER: 'tournament_insert_player',
+            INSERT_SCOREBOARD: 'tournament_insert_scoreboard',
+            STANDINGS: 'tournament_standings',
+            HAVE_MET: 'tournament_have_met',
+            NEW_OPPONENTS: 'tournament_new_opponents',
+            INSERT_MATCH: 'tournament_insert_match',
+            ADD_SCORE: 'tournament_add_score',
+            OPPONENTS_GAIN: 'tournament_opponents_gain',
+            ADD_BYE: 'tournament_add_bye',
+            HAS_BYE: 'tournament_has_bye',
+            VALID_PAIR: 'tournament_valid_pair',
+            PAIRING_SNAPSHOT: 'tournament_pairing_snapshot'}
+
+
+def execute(c, sql, args):
+    """Runs a statement, as a prepared statement when it is a hot one.
+
+    With PREPARED_STATEMENTS on, each connection prepares a statement listed
+    in PREPARED the first time it runs it and afterwards executes it by
+    name, so PostgreSQL parses and plans it once per pooled connection
+    instead of on every call.
+
+    Args:
+        c: cursor to run the statement with
+        sql: the statement, with %s placeholders
+        args: sequence of values for the placeholders
+    """
+    name = PREPARED.get(sql)
+    if not PREPARED_STATEMENTS or name is None:
+        c.execute(sql, args)
+        return
+    with _preparedLock:
+        prepared = _prepared.setdefault(c.connection, set())
+    if name not in prepared:
+        parts = sql.split('%s')
+        numbered = parts[0] + ''.join('$%d%s' % (n, part)
+                                      for n, part in enumerate(parts[1:], 1))
+        c.execute("PREPARE %s AS %s" % (name, numbered))
+        prepared.add(name)
+    c.execute("EXECUTE %s (%s)" % (name, ', '.join(['%s'] * len(args))), args)
+
+
+@instrumented
+def deleteMatches(conn=None):
+    """Remove all the match records from the database.
+
+    Like the other delete functions this truncates, which is immediate at
+    any size but waits for every other transaction using the table.
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("TRUNCATE matches")
+        standingsChanged(c)
+
+
+@instrumented
+def deletePlayers(conn=None):
+    """Remove all the player records, and whatever refers to them."""
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("TRUNCATE players CASCADE")
+        standingsChanged(c)
+
+@instrumented
+def deleteTournaments(conn=None):
+    """Remove all the tournament records, and whatever refers to them."""
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("TRUNCATE tournaments CASCADE")
+        c.execute("""DELETE FROM rated_rounds
+                     WHERE tournament NOT IN (SELECT id
+                                              FROM tournaments_archive)""")
+        standingsChanged(c)
+
+
+@instrumented
+def deleteScoreboard(conn=None):
     """Remove all the scoreboard records from the database."""
-    DB = connect()
-    c = DB.cursor()
-    c.execute("DELETE FROM scoreboard")
-    DB.commit()
-    DB.close()
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("TRUNCATE scoreboard")
+        standingsChanged(c)
+
+@instrumented
+def resetDatabase(archives=False, conn=None):
+    """Empty every tournament table at once.
+
+    Args:
+        archives: also empty the archive tables
+        conn: optional connection to run in, see transaction()
+    """
+    tables = LIVE_TABLES + (ARCHIVE_TABLES if archives else ())
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("TRUNCATE %s" % ', '.join(tables))
+        standingsChanged(c)
+
+@instrumented
+def deleteTournament(tid, conn=None):
+    """Remove one tournament, its matches, scoreboard and players.
+
+    Players are only removed if they are not entered in another tournament
+    and have no rating, see ratings.py.
+
+    Args:
+        tid: id of tournament
+        conn: optional connection to run in, see transaction()
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        c.execute(DELETE_TOURNAMENT_PLAYERS, (tid, tid))
+        c.execute("DELETE FROM tournaments WHERE id = %s", (tid,))
+        c.execute("DELETE FROM rated_rounds WHERE tournament = %s", (tid,))
+        standingsChanged(c, tid)
+
+@instrumented
+def archiveTournament(tid, conn=None):
+    """Move a finished tournament to the archive tables.
+
+    The tournament's matches, scoreboard and standings history are copied
+    over in bulk, then it is removed from the live tables.  Its players go
+    as with deleteTournament(), except those who played in a closed round:
+    ratings.py rates archived games as well.
+
+    Args:
+        tid: id of tournament
+        conn: optional connection to run in, see transaction()
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        c.execute("""INSERT INTO tournaments_archive
+                     SELECT * FROM tournaments WHERE id = %s""", (tid,))
+        c.execute("""INSERT INTO matches_archive
+                     SELECT * FROM matches WHERE tournament = %s""", (tid,))
+        c.execute("""INSERT INTO scoreboard_archive
+                     SELECT s.*, p.name
+                     FROM scoreboard AS s
+                     INNER JOIN players AS p ON p.id = s.player
+                     WHERE s.tournament = %s""", (tid,))
+        c.execute("""INSERT INTO standings_history_archive
+                     SELECT * FROM standings_history WHERE tournament = %s""",
+                  (tid,))
+        c.execute(ARCHIVE_TOURNAMENT_PLAYERS, (tid, tid, tid))
+        c.execute("DELETE FROM tournaments WHERE id = %s", (tid,))
+        standingsChanged(c, tid)
 
-def createTournament(name):
+@instrumented
+def createTournament(name, conn=None):
     """Create a new tournament.
 
     Args:
         Name of tournament
+        conn: optional connection to run in, see transaction()
     """
-    DB = connect()
-    c = DB.cursor()
-    sql = "INSERT INTO tournaments (name) VALUES (%s) RETURNING id"
-    c.execute(sql, (name,))
-    tid = c.fetchone()[0]
-    DB.commit()
-    DB.close()
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        sql = "INSERT INTO tournaments (name) VALUES (%s) RETURNING id"
+        c.execute(sql, (name,))
+        tid = c.fetchone()[0]
     return tid
 
-def countPlayers(tid):
+@instrumented
+def countPlayers(tid, conn=None):
     """Returns the number of players currently registered for a tournament.
 
     Args:
         tid: id of tournament
+        conn: optional connection to run in, see transaction()
     """
-    DB = connect()
-    c = DB.cursor()
-    sql = """SELECT count(player) AS num
-             FROM scoreboard
-             WHERE tournament = %s"""
-    c.execute(sql, (tid,))
-    players = c.fetchone()[0]
-    DB.close()
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        sql = """SELECT count(player) AS num
+                 FROM scoreboard
+                 WHERE tournament = %s"""
+        c.execute(sql, (tid,))
+        players = c.fetchone()[0]
     return players
 
-def registerPlayer(name, tid):
+@instrumented
+def registerPlayer(name, tid, conn=None):
     """Adds a player to the tournament database.
 
     The database assigns a unique serial id number for the player.  (This
@@ -85,193 +775,463 @@ def registerPlayer(name, tid):
     Args:
       name: the player's full name (need not be unique).
       tid: id of tournament they are entering.
+      conn: optional connection to run in, see transaction()
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        execute(c, INSERT_PLAYER, (name,))
+        playerid = c.fetchone()[0]
+        execute(c, INSERT_SCOREBOARD, (tid,playerid,0,0,0))
+        standingsChanged(c, tid)
+
+
+@instrumented
+def registerPlayers(names, tid, conn=None):
+    """Adds many players to a tournament at once.
+
+    Ids are drawn from the players sequence in one query, then players and
+    scoreboard rows are written with a multi-row insert each, all in one
+    transaction.
+
+    Args:
+      names: iterable of the players' full names
+      tid: id of tournament they are entering
+      conn: optional connection to run in, see transaction()
+
+    Returns the ids assigned to the players, in the order of names.
+    """
+    names = list(names)
+    if not names:
+        return []
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        ids = """SELECT nextval(pg_get_serial_sequence('players', 'id'))
+                 FROM generate_series(1, %s)"""
+        c.execute(ids, (len(names),))
+        playerids = [row[0] for row in c.fetchall()]
+        players = "INSERT INTO players (id, name) VALUES %s"
+        psycopg2.extras.execute_values(c, players, zip(playerids, names),
+                                       page_size=BATCH_SIZE)
+        scoreboard = """INSERT INTO scoreboard (tournament,player,score,matches,bye)
+                        SELECT %s, player, 0, 0, 0
+                        FROM unnest(%s) AS player"""
+        c.execute(scoreboard, (tid, playerids))
+        standingsChanged(c, tid)
+    return playerids
+
+@instrumented
+def importPlayers(csvfile, tid, conn=None):
+    """Registers every player listed in a CSV file.
+
+    The first column of each row holds a player's name; blank rows and a
+    leading "name" header row are skipped.
+
+    Args:
+      csvfile: path of the CSV file to read
+      tid: id of tournament they are entering
+      conn: optional connection to run in, see transaction()
+
+    Returns the ids assigned to the players, in file order.
     """
-    DB = connect()
-    c = DB.cursor()
-    player = "INSERT INTO players (name) VALUES (%s) RETURNING id"
-    scoreboard = "INSERT INTO scoreboard (tournament,player,score,matches,bye) VALUES (%s,%s,%s,%s,%s)"
-    c.execute(player, (name,))
-    playerid = c.fetchone()[0]
-    c.execute(scoreboard, (tid,playerid,0,0,0))
-    DB.commit()
-    DB.close()
+    with open(csvfile) as roster:
+        names = [row[0].strip() for row in csv.reader(roster)
+                 if row and row[0].strip()]
+    if names and names[0].lower() == 'name':
+        names = names[1:]
+    return registerPlayers(names, tid, conn)
 
 
-def playerStandings(tid):
+@instrumented
+def playerStandings(tid, conn=None):
     """Returns a list of the players and their win records, sorted by wins.
 
     The first entry in the list should be the player in first place, or a player
-    tied for first place if there is currently a tie.
+    tied for first place if there is currently a tie.  Ties are broken by
+    owm, then matches played, then player id.
 
     Args:
         tid: id of tournament getting standings for
+        conn: optional connection to run in, see transaction()
 
     Returns:
-      A list of tuples, each of which contains (id, name, wins, matches):
+      A list of tuples, each of which contains
+      (id, name, wins, matches, bye, owm):
         id: the player's unique id (assigned by the database)
         name: the player's full name (as registered)
         wins: the number of matches the player has won
         matches: the number of matches the player has played
+        bye: the number of byes the player has had
+        owm: opponent match wins, the summed score of the player's opponents
+
+    Without conn the result comes from the standings cache when nothing has
+    been written to the tournament since it was last read, and no write to
+    it is waiting to be committed.  The cache is only used while
+    STANDINGS_NOTIFY is set and listenForStandings() is running.
     """
-    DB = connect()
-    c = DB.cursor()
-    players = """SELECT s.player, p.name, s.score, s.matches, s.bye,
-                    (SELECT SUM(s2.score)
-                     FROM scoreboard AS s2
-                     WHERE s2.player IN (SELECT loser
-                                     FROM matches
-                                     WHERE winner = s.player
-                                     AND tournament = %s)
-                     OR s2.player IN(SELECT winner
-                                 FROM matches
-                                 WHERE loser = s.player
-                                 AND tournament = %s)) AS owm
-                 FROM scoreboard AS s
-                 INNER JOIN players AS p on p.id = s.player
-                 WHERE tournament = %s
-                 ORDER BY s.score DESC, owm DESC, s.matches DESC"""
-    c.execute(players, (tid,tid,tid))
-    ranks = []
-    for row in c.fetchall():
-        ranks.append(row)
-    DB.close()
+    cached = (conn is None and STANDINGS_CACHE and STANDINGS_NOTIFY
+              and _listening.is_set() and not pendingStandingsWrite(tid))
+    if cached:
+        version = standingsVersion(tid)
+        hit = _standings.get(tid)
+        if hit is not None and hit[0] == version:
+            return list(hit[1])
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        execute(c, STANDINGS, (tid,))
+        ranks = []
+        for row in c.fetchall():
+            ranks.append(row)
+    if cached:
+        with _cacheLock:
+            if standingsVersion(tid) == version:
+                _standings[tid] = (version, list(ranks))
     return ranks
 
-def reportMatch(tid, winner, loser, draw='FALSE'):
+def matchDraw(draw):
+    """Returns whether a match was a draw, as a bool.
+
+    Args:
+        draw: True or 'TRUE' for a draw, False or 'FALSE' otherwise
+
+    Raises ValueError for anything else.
+    """
+    if draw is True or draw == 'TRUE':
+        return True
+    if draw is False or draw == 'FALSE':
+        return False
+    raise ValueError("A match is a draw or not, not %r" % (draw,))
+
+def matchPoints(draw):
+    """Returns the (winner, loser) points for a match.
+
+    Args:
+        draw: if the match was a draw, see matchDraw()
+    """
+    if matchDraw(draw):
+        return 1, 1
+    return 3, 0
+
+@instrumented
+def refreshOpponentMatchWins(tid, conn=None):
+    """Recomputes owm for a whole tournament with one set-based update.
+
+    Args:
+        tid: id of tournament
+        conn: optional connection to run in, see transaction()
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        sql = """UPDATE scoreboard AS s SET owm = omw.owm
+                 FROM (SELECT o.player, SUM(os.score) AS owm
+                       FROM opponents AS o
+                       INNER JOIN scoreboard AS os
+                           ON os.tournament = o.tournament
+                           AND os.player = o.opponent
+                       WHERE o.tournament = %s
+                       GROUP BY o.player) AS omw
+                 WHERE s.tournament = %s AND s.player = omw.player"""
+        c.execute(sql, (tid, tid))
+        standingsChanged(c, tid)
+
+@instrumented
+def reportMatch(tid, winner, loser, draw='FALSE', conn=None):
     """Records the outcome of a single match between two players.
 
     Args:
       tid: the id of the tournament match was in
       winner:  the id number of the player who won
       loser:  the id number of the player who lost
-      draw:  if the match was a draw
-    """
-    if draw == 'TRUE':
-        w_points = 1
-        l_points = 1
-    else:
-        w_points = 3
-        l_points = 0
-
-    DB = connect()
-    c = DB.cursor()
-    ins = "INSERT INTO matches (tournament, winner, loser, draw) VALUES (%s,%s,%s,%s)"
-    win = "UPDATE scoreboard SET score = score+%s, matches = matches+1 WHERE player = %s AND tournament = %s"
-    los = "UPDATE scoreboard SET score = score+%s, matches = matches+1 WHERE player = %s AND tournament = %s"
-    c.execute(ins, (tid, winner, loser, draw))
-    c.execute(win, (w_points, winner, tid))
-    c.execute(los, (l_points, loser, tid))
-    DB.commit()
-    DB.close()
-
-def hasBye(id, tid):
+      draw:  if the match was a draw, see matchDraw()
+      conn: optional connection to run in, see transaction()
+    """
+    w_points, l_points = matchPoints(draw)
+    draw = matchDraw(draw)
+
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        execute(c, HAVE_MET, (tid, winner, loser))
+        if not c.fetchone()[0]:
+            execute(c, NEW_OPPONENTS, (tid, winner, loser, loser, winner))
+        execute(c, INSERT_MATCH, (winner, loser, draw, tid))
+        execute(c, ADD_SCORE, (w_points, winner, tid))
+        execute(c, ADD_SCORE, (l_points, loser, tid))
+        execute(c, OPPONENTS_GAIN, (w_points, tid, tid, winner))
+        execute(c, OPPONENTS_GAIN, (l_points, tid, tid, loser))
+        standingsChanged(c, tid)
+
+@instrumented
+def reportRound(tid, results, conn=None):
+    """Records the outcome of every match of a round at once.
+
+    All matches are inserted with one statement and the scoreboard is
+    updated set-wise, in a single transaction: either the whole round is
+    recorded or, if anything fails, none of it is.
+
+    Args:
+      tid: the id of the tournament the round was in
+      results: iterable of (winner, loser, draw) tuples, as for reportMatch()
+      conn: optional connection to run in, see transaction()
+    """
+    matches = []
+    points = {}
+    for (winner, loser, draw) in results:
+        w_points, l_points = matchPoints(draw)
+        matches.append((tid, winner, loser, matchDraw(draw)))
+        for (player, gain) in ((winner, w_points), (loser, l_points)):
+            scored, played = points.get(player, (0, 0))
+            points[player] = (scored + gain, played + 1)
+    if not matches:
+        return
+
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        ins = """INSERT INTO matches (tournament, winner, loser, draw, round)
+                 SELECT r.tournament, r.winner, r.loser, r.draw, t.rounds + 1
+                 FROM (VALUES %s) AS r (tournament, winner, loser, draw)
+                 INNER JOIN tournaments AS t ON t.id = r.tournament"""
+        psycopg2.extras.execute_values(c, ins, matches,
+                                       page_size=len(matches))
+        scores = """UPDATE scoreboard AS s
+                    SET score = s.score + r.points,
+                        matches = s.matches + r.played
+                    FROM (VALUES %s) AS r (tournament, player, points, played)
+                    WHERE s.tournament = r.tournament AND s.player = r.player"""
+        rows = [(tid, player, scored, played)
+                for player, (scored, played) in points.items()]
+        psycopg2.extras.execute_values(c, scores, rows, page_size=len(rows))
+        if c.rowcount != len(rows):
+            raise ValueError(
+                "Every player in the round must be registered in tournament %s"
+                % (tid,))
+        refreshOpponentMatchWins(tid, DB)
+
+@instrumented
+def currentRound(tid, conn=None):
+    """Returns the number of the round in progress, counting from 1.
+
+    Args:
+        tid: id of tournament
+        conn: optional connection to run in, see transaction()
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        c.execute("SELECT rounds + 1 FROM tournaments WHERE id = %s", (tid,))
+        return c.fetchone()[0]
+
+@instrumented
+def closeRound(tid, conn=None):
+    """Closes the round in progress and records the standings after it.
+
+    Args:
+        tid: id of tournament
+        conn: optional connection to run in, see transaction()
+
+    Returns the number of the round closed.
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        close = """UPDATE tournaments SET rounds = rounds + 1
+                   WHERE id = %s
+                   RETURNING rounds"""
+        c.execute(close, (tid,))
+        closed = c.fetchone()[0]
+        snapshot = """INSERT INTO standings_history
+                          (tournament, round, player, rank,
+                           score, matches, bye, owm)
+                      SELECT tournament, %s, player,
+                             row_number() OVER (ORDER BY score DESC, owm DESC,
+                                                         matches DESC, player),
+                             score, matches, bye, owm
+                      FROM scoreboard
+                      WHERE tournament = %s"""
+        c.execute(snapshot, (closed, tid))
+    return closed
+
+@instrumented
+def standingsAfterRound(tid, round, conn=None):
+    """Returns the standings as they were when a round closed.
+
+    Args:
+        tid: id of tournament
+        round: number of a closed round
+        conn: optional connection to run in, see transaction()
+
+    Returns a list of (id, name, wins, matches, bye, owm) tuples, best
+    first, like playerStandings().
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        sql = """SELECT h.player, p.name, h.score, h.matches, h.bye, h.owm
+                 FROM standings_history AS h
+                 INNER JOIN players AS p ON p.id = h.player
+                 WHERE h.tournament = %s AND h.round = %s
+                 ORDER BY h.rank"""
+        c.execute(sql, (tid, round))
+        return c.fetchall()
+
+@instrumented
+def playerHistory(tid, player, conn=None):
+    """Returns a player's standing after every closed round.
+
+    Args:
+        tid: id of tournament
+        player: id of player
+        conn: optional connection to run in, see transaction()
+
+    Returns a list of (round, rank, wins, matches, bye, owm) tuples.
+    """
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        sql = """SELECT round, rank, score, matches, bye, owm
+                 FROM standings_history
+                 WHERE tournament = %s AND player = %s
+                 ORDER BY round"""
+        c.execute(sql, (tid, player))
+        return c.fetchall()
+
+@instrumented
+def hasBye(id, tid, conn=None):
     """Checks if player has bye.
 
     Args:
         id: id of player to check
+        tid: the id of the tournament
+        conn: optional connection to run in, see transaction()
 
     Returns true or false.
     """
-    DB = connect()
-    c= DB.cursor()
-    sql = """SELECT bye
-             FROM scoreboard
-             WHERE player = %s
-             AND tournament = %s"""
-    c.execute(sql, (id,tid))
-    bye = c.fetchone()[0]
-    DB.close()
-    if bye == 0:
-        return True
-    else:
-        return False
+    with transaction(conn) as DB:
+        c= DB.cursor()
+        execute(c, HAS_BYE, (id,tid))
+        bye = c.fetchone()[0]
+    return bye > 0
 
-def reportBye(player, tid):
+@instrumented
+def reportBye(player, tid, conn=None):
     """Assign points for a bye.
 
     Args:
       player: id of player who receives a bye.
       tid: the id of the tournament
+      conn: optional connection to run in, see transaction()
     """
-    DB = connect()
-    c = DB.cursor()
-    bye = "UPDATE scoreboard SET score = score+3, bye=bye+1 WHERE player = %s AND tournament = %s"
-    c.execute(bye, (player,tid))
-    DB.commit()
-    DB.close()
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        lockTournament(c, tid)
+        execute(c, ADD_BYE, (player,tid))
+        execute(c, OPPONENTS_GAIN, (3, tid, tid, player))
+        standingsChanged(c, tid)
 
 
-def checkByes(tid, ranks, index):
+@instrumented
+def checkByes(tid, ranks, index, conn=None):
     """Checks if players already have a bye
 
+    Walks up the standings from index without further queries, reading who
+    had a bye from the bye column of ranks; see pairing.pickBye().
+
     Args:
         tid: tournament id
-        ranks: list of current ranks from swissPairings()
-        index: index to check
+        ranks: list of current ranks from playerStandings()
+        index: index to check, negative from the end of ranks
+        conn: optional connection to run in, see transaction()
 
-    Returns first id that is valid or original id if none are found.
+    Returns the negative index of the first player from index up without a
+    bye, or -1 if none are found.
     """
-    if abs(index) > len(ranks):
+    byes = set(row[0] for row in ranks if row[4] > 0)
+    found = pairing.pickBye(ranks, byes, index)
+    if found < 0:
         return -1
-    elif not hasBye(ranks[index][0], tid):
-        return index
-    else:
-        return checkByes(tid, ranks, (index - 1))
+    return found - len(ranks)
 
-def validPair(player1, player2, tid):
+@instrumented
+def validPair(player1, player2, tid, conn=None):
     """Checks if two players have already played against each other
 
     Args:
         player1: the id number of first player to check
         player2: the id number of potentail paired player
         tid: the id of the tournament
+        conn: optional connection to run in, see transaction()
 
     Return true if valid pair, false if not
     """
-    DB = connect()
-    c = DB.cursor()
-    sql = """SELECT winner, loser
-             FROM matches
-             WHERE ((winner = %s AND loser = %s)
-                    OR (winner = %s AND loser = %s))
-             AND tournament = %s"""
-    c.execute(sql, (player1, player2, player2, player1, tid))
-    matches = c.rowcount
-    DB.close()
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        execute(c, VALID_PAIR, (player1, player2, player2, player1, tid))
+        matches = c.rowcount
     if matches > 0:
         return False
     return True
 
-def checkPairs(tid, ranks, id1, id2):
+@instrumented
+def checkPairs(tid, ranks, id1, id2, played=None, conn=None):
     """Checks if two players have already had a match against each other.
-    If they have, recursively checks through the list until a valid match is
-    found.
+    If they have, checks on down the list until a valid match is found.
+
+    Searches played without further queries, as checkByes() reads the bye
+    column of ranks; see pairing.pickOpponent().  Only without played is
+    the tournament's match history read, once per call.
+
+    Args:
+        tid: id of tournament
+        ranks: list of current ranks from playerStandings()
+        id1: index of player needing a match
+        id2: index of potential matched player
+        played: set of frozensets of pairs that already met, as returned
+            by pairingSnapshot()
+        conn: optional connection to run in, see transaction()
+
+    Returns index of matched player, or id1 + 1 if none are found.
+    """
+    if played is None:
+        with transaction(conn) as DB:
+            c = DB.cursor()
+            c.execute("""SELECT winner, loser
+                         FROM matches
+                         WHERE tournament = %s""", (tid,))
+            played = pairing.playedPairs(c.fetchall())
+    return pairing.pickOpponent(ranks, played, id1, id2)
+
+@instrumented
+def pairingSnapshot(tid, conn=None):
+    """Loads everything needed to pair a round in a single query.
 
     Args:
         tid: id of tournament
-        ranks: list of current ranks from swissPairings()
-        id1: player needing a match
-        id2: potential matched player
+        conn: optional connection to run in, see transaction()
 
-    Returns id of matched player or original match if none are found.
+    Returns a tuple (ranks, played, byes), see pairing.readSnapshot().
     """
-    if id2 >= len(ranks):
-        return id1 + 1
-    elif validPair(ranks[id1][0], ranks[id2][0], tid):
-        return id2
-    else:
-        return checkPairs(tid, ranks, id1, (id2 + 1))
+    with transaction(conn) as DB:
+        c = DB.cursor()
+        execute(c, PAIRING_SNAPSHOT, (tid, tid))
+        rows = c.fetchall()
+    return pairing.readSnapshot(rows)
 
-def swissPairings(tid):
+@instrumented
+def swissPairings(tid, mode=pairing.GREEDY, conn=None):
     """Returns a list of pairs of players for the next round of a match.
 
     Assuming that there are an even number of players registered, each player
     appears exactly once in the pairings.  Each player is paired with another
     player with an equal or nearly-equal win record, that is, a player adjacent
-    to him or her in the standings.
+    to him or her in the standings.  With an odd number of players the lowest
+    ranked player without a bye sits out and is credited a bye.
 
     Args:
         tid: id of tournament you are gettings standings for
+        mode: pairing.GREEDY walks down the standings taking the first
+            opponent not met yet; pairing.WEIGHTED finds the pairing with the
+            smallest score differences that avoids rematches wherever possible
+        conn: optional connection to run in, see transaction()
 
     Returns:
       A list of tuples, each of which contains (id1, name1, id2, name2)
@@ -280,18 +1240,11 @@ def swissPairings(tid):
         id2: the second player's unique id
         name2: the second player's name
     """
-    ranks = playerStandings(tid)
-    pairs = []
-
-    numPlayers = countPlayers(tid)
-    if numPlayers % 2 != 0:
-        bye = ranks.pop(checkByes(tid, ranks, -1))
-        reportBye(tid, bye[0])
-
-    while len(ranks) > 1:
-        validMatch = checkPairs(tid,ranks,0,1)
-        player1 = ranks.pop(0)
-        player2 = ranks.pop(validMatch - 1)
-        pairs.append((player1[0],player1[1],player2[0],player2[1]))
-
+    with transaction(conn) as DB:
+        # Hold the tournament for the whole read-pair-bye sequence.
+        lockTournament(DB.cursor(), tid)
+        ranks, played, byes = pairingSnapshot(tid, DB)
+        pairs, bye = pairing.pairRound(ranks, played, byes, mode)
+        if bye is not None:
+            reportBye(bye[0], tid, DB)
     return pairs
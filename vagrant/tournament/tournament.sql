@@ -5,21 +5,143 @@
 --
 -- You can write comments in this file by starting them with two dashes, like
 -- these lines here.
+--
+-- Needs PostgreSQL 11 or later for hash partitioning and foreign keys on
+-- partitioned tables (ratings.py also uses ON CONFLICT, 9.5+), and psycopg2
+-- 2.7 or later for execute_values().  pg_config.sh installs both.
 
-CREATE TABLE players ( id SERIAL,
+CREATE TABLE players ( id SERIAL PRIMARY KEY,
                        name TEXT );
 
-CREATE TABLE tournaments ( id SERIAL,
-                           name TEXT );
+-- rounds counts the rounds closed so far; matches reported now belong to
+-- round rounds + 1.
+CREATE TABLE tournaments ( id SERIAL PRIMARY KEY,
+                           name TEXT,
+                           rounds INTEGER NOT NULL DEFAULT 0 );
 
+-- matches and scoreboard are hash partitioned by tournament (see the end of
+-- this file), so every query of one tournament only touches one partition;
+-- their primary keys have to lead with it.
 CREATE TABLE matches ( matchid SERIAL,
-                       tournament INTEGER,
-                       winner INTEGER,
-                       loser INTEGER,
-                       draw BOOLEAN );
+                       tournament INTEGER REFERENCES tournaments (id)
+                                          ON DELETE CASCADE,
+                       winner INTEGER REFERENCES players (id) ON DELETE CASCADE,
+                       loser INTEGER REFERENCES players (id) ON DELETE CASCADE,
+                       draw BOOLEAN,
+                       round INTEGER,
+                       PRIMARY KEY (tournament, matchid) )
+    PARTITION BY HASH (tournament);
+
+-- Standings and pairing look matches up by tournament and by either player.
+CREATE INDEX matches_tournament_winner ON matches (tournament, winner);
+CREATE INDEX matches_tournament_loser ON matches (tournament, loser);
+
+-- Removing a player cascades to their matches without knowing the
+-- tournament; these keep that from scanning every partition.
+CREATE INDEX matches_winner ON matches (winner);
+CREATE INDEX matches_loser ON matches (loser);
 
-CREATE TABLE scoreboard ( tournament INTEGER,
-                          player INTEGER,
+-- The primary key doubles as the (tournament, player) index.  owm holds
+-- opponent match wins, the summed score of every distinct opponent; it is
+-- kept up to date by reportMatch() and reportBye() so standings are a plain
+-- indexed read.
+CREATE TABLE scoreboard ( tournament INTEGER REFERENCES tournaments (id)
+                                             ON DELETE CASCADE,
+                          player INTEGER REFERENCES players (id)
+                                         ON DELETE CASCADE,
                           score INTEGER,
                           matches INTEGER,
-                          bye INTEGER );
+                          bye INTEGER,
+                          owm INTEGER NOT NULL DEFAULT 0,
+                          PRIMARY KEY (tournament, player) )
+    PARTITION BY HASH (tournament);
+
+-- Ties are broken by player id, so standings come back in one order.
+CREATE INDEX scoreboard_ranking
+    ON scoreboard (tournament, score DESC, owm DESC, matches DESC, player);
+
+CREATE INDEX scoreboard_player ON scoreboard (player);
+
+-- Standings as they were when each round closed, one row per player and
+-- round, so history is read back rather than replayed from matches.
+CREATE TABLE standings_history ( tournament INTEGER REFERENCES tournaments (id)
+                                                    ON DELETE CASCADE,
+                                 round INTEGER,
+                                 player INTEGER REFERENCES players (id)
+                                                ON DELETE CASCADE,
+                                 rank INTEGER,
+                                 score INTEGER,
+                                 matches INTEGER,
+                                 bye INTEGER,
+                                 owm INTEGER,
+                                 PRIMARY KEY (tournament, round, player) );
+
+CREATE INDEX standings_history_player
+    ON standings_history (tournament, player, round);
+
+-- Player ratings across tournaments, one row per rating system, kept by
+-- ratings.py.  deviation is NULL for Elo.
+CREATE TABLE ratings ( system TEXT,
+                       player INTEGER REFERENCES players (id) ON DELETE CASCADE,
+                       rating DOUBLE PRECISION,
+                       deviation DOUBLE PRECISION,
+                       games INTEGER,
+                       PRIMARY KEY (system, player) );
+
+-- Rounds already folded into the ratings of each system.  tournament may be
+-- live or archived, so it has no foreign key; deleteTournament() and
+-- deleteTournaments() clear the rows of the tournaments they delete.
+CREATE TABLE rated_rounds ( system TEXT,
+                            tournament INTEGER,
+                            round INTEGER,
+                            PRIMARY KEY (system, tournament, round) );
+
+-- Finished tournaments moved out of the live tables by archiveTournament().
+-- Archived scoreboards keep the player's name, as players without rated or
+-- ratable games are removed.  ratings.py reads archived games too.
+CREATE TABLE tournaments_archive ( LIKE tournaments,
+                                   archived TIMESTAMP
+                                            DEFAULT CURRENT_TIMESTAMP,
+                                   PRIMARY KEY (id) );
+
+CREATE TABLE matches_archive ( LIKE matches,
+                               PRIMARY KEY (matchid) );
+
+CREATE INDEX matches_archive_tournament ON matches_archive (tournament);
+
+CREATE TABLE scoreboard_archive ( LIKE scoreboard,
+                                  name TEXT,
+                                  PRIMARY KEY (tournament, player) );
+
+CREATE TABLE standings_history_archive ( LIKE standings_history,
+                                         PRIMARY KEY (tournament, round,
+                                                      player) );
+
+-- Every distinct (player, opponent) pairing of a tournament, seen from both
+-- sides.
+CREATE VIEW opponents AS
+    SELECT tournament, winner AS player, loser AS opponent FROM matches
+    UNION
+    SELECT tournament, loser AS player, winner AS opponent FROM matches;
+
+-- Scoreboard rows with player names.
+CREATE VIEW standings AS
+    SELECT s.tournament, s.player, p.name, s.score, s.matches, s.bye, s.owm
+    FROM scoreboard AS s
+    INNER JOIN players AS p ON p.id = s.player;
+
+-- The partitions of matches and scoreboard.  Sixteen keep each one small into
+-- the tens of millions of matches; to change the count, recreate the
+-- database with a different modulus.
+DO $$
+BEGIN
+    FOR remainder IN 0..15 LOOP
+        EXECUTE format('CREATE TABLE matches_%s PARTITION OF matches
+                        FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+                       remainder, remainder);
+        EXECUTE format('CREATE TABLE scoreboard_%s PARTITION OF scoreboard
+                        FOR VALUES WITH (MODULUS 16, REMAINDER %s)',
+                       remainder, remainder);
+    END LOOP;
+END
+$$;
@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+#
+# tournament_async.py -- asyncio counterpart of the tournament.py API
+#
+# The coroutines here mirror their namesakes in tournament.py, running the
+# same SQL over an aiopg connection pool so an event loop can multiplex many
+# concurrent requests over a handful of connections.  Needs Python 3.7+ and
+# aiopg; tournament.py itself stays importable without either.
+#
+
+import asyncio
+from contextlib import asynccontextmanager
+
+import aiopg
+
+import pairing
+import tournament
+
+# Bounds for the module connection pool, see configurePool().
+POOL_MINSIZE = 1
+POOL_MAXSIZE = 10
+
+_pool = None
+_poolLock = None
+
+
+async def configurePool(minsize=POOL_MINSIZE, maxsize=POOL_MAXSIZE,
+                        dsn=tournament.DSN, **kwargs):
+    """Create (or replace) the module connection pool.
+
+    Args:
+        minsize: connections opened up front and kept open
+        maxsize: most connections the pool will hand out at once
+        dsn: libpq connection string for the tournament database
+        kwargs: passed on to aiopg.create_pool()
+    """
+    global _pool
+    await closePool()
+    _pool = await aiopg.create_pool(dsn, minsize=minsize, maxsize=maxsize,
+                                    **kwargs)
+    return _pool
+
+
+async def closePool():
+    """Close every connection held by the module connection pool."""
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        await _pool.wait_closed()
+    _pool = None
+
+
+async def getPool():
+    """Returns the module connection pool, creating it on first use."""
+    global _poolLock
+    if _pool is not None and not _pool.closed:
+        return _pool
+    if _poolLock is None:
+        _poolLock = asyncio.Lock()
+    async with _poolLock:
+        if _pool is None or _pool.closed:
+            await configurePool()
+        return _pool
+
+
+@asynccontextmanager
+async def transaction(conn=None):
+    """Async context manager yielding a connection for one transaction.
+
+    aiopg connections run in autocommit mode, so the transaction is opened
+    and closed explicitly: committed when the block succeeds, rolled back
+    when it raises.
+
+    Args:
+        conn: an already open connection to reuse.  Commit and rollback are
+            then left to the caller, as with tournament.transaction().
+    """
+    if conn is not None:
+        yield conn
+        return
+    pool = await getPool()
+    async with pool.acquire() as DB:
+        async with DB.cursor() as c:
+            await c.execute("BEGIN")
+            try:
+                yield DB
+            except Exception:
+                await c.execute("ROLLBACK")
+                raise
+            else:
+                await c.execute("COMMIT")
+            finally:
+                # As in tournament.transaction(), standings cached while the
+                # transaction was open may predate its writes.
+                tournament.settleStandingsWrites(DB.raw)
+
+
+async def _lockTournament(c, tid):
+    await c.execute(tournament.LOCK_TOURNAMENT, (tournament.LOCK_CLASS, tid))
+
+
+async def _standingsChanged(c, tid):
+    # Keeps the standings cache of tournament.py coherent when both APIs
+    # are used in one process, and notifies other processes if asked to.
+    tournament.invalidateStandings(tid)
+    tournament.trackStandingsWrite(c.connection.raw, tid)
+    if tournament.STANDINGS_NOTIFY:
+        await c.execute("SELECT pg_notify(%s, %s)",
+                        (tournament.STANDINGS_CHANNEL, str(tid)))
+
+
+async def createTournament(name, conn=None):
+    """Create a new tournament.  Returns its id.
+
+    Args:
+        name: name of tournament
+        conn: optional connection to run in, see transaction()
+    """
+    async with transaction(conn) as DB:
+        async with DB.cursor() as c:
+            sql = "INSERT INTO tournaments (name) VALUES (%s) RETURNING id"
+            await c.execute(sql, (name,))
+            return (await c.fetchone())[0]
+
+
+async def registerPlayer(name, tid, conn=None):
+    """Adds a player to a tournament.  Returns the player's id.
+
+    Args:
+        name: the player's full name (need not be unique)
+        tid: id of tournament they are entering
+        conn: optional connection to run in, see transaction()
+    """
+    async with transaction(conn) as DB:
+        async with DB.cursor() as c:
+            await _lockTournament(c, tid)
+            await c.execute(tournament.INSERT_PLAYER, (name,))
+            playerid = (await c.fetchone())[0]
+            await c.execute(tournament.INSERT_SCOREBOARD,
+                            (tid, playerid, 0, 0, 0))
+            await _standingsChanged(c, tid)
+    return playerid
+
+
+async def playerStandings(tid, conn=None):
+    """Returns the standings of a tournament, best first.
+
+    Args:
+        tid: id of tournament getting standings for
+        conn: optional connection to run in, see transaction()
+
+    Returns a list of (id, name, wins, matches, bye, owm) tuples, as
+    tournament.playerStandings() does.
+    """
+    async with transaction(conn) as DB:
+        async with DB.cursor() as c:
+            await c.execute(tournament.STANDINGS, (tid,))
+            return await c.fetchall()
+
+
+async def reportMatch(tid, winner, loser, draw='FALSE', conn=None):
+    """Records the outcome of a single match between two players.
+
+    Args:
+        tid: the id of the tournament match was in
+        winner: the id number of the player who won
+        loser: the id number of the player who lost
+        draw: if the match was a draw, see tournament.matchDraw()
+        conn: optional connection to run in, see transaction()
+    """
+    w_points, l_points = tournament.matchPoints(draw)
+    draw = tournament.matchDraw(draw)
+    async with transaction(conn) as DB:
+        async with DB.cursor() as c:
+            await _lockTournament(c, tid)
+            await c.execute(tournament.HAVE_MET, (tid, winner, loser))
+            if not (await c.fetchone())[0]:
+                await c.execute(tournament.NEW_OPPONENTS,
+                                (tid, winner, loser, loser, winner))
+            await c.execute(tournament.INSERT_MATCH,
+                            (winner, loser, draw, tid))
+            await c.execute(tournament.ADD_SCORE, (w_points, winner, tid))
+            await c.execute(tournament.ADD_SCORE, (l_points, loser, tid))
+            await c.execute(tournament.OPPONENTS_GAIN,
+                            (w_points, tid, tid, winner))
+            await c.execute(tournament.OPPONENTS_GAIN,
+                            (l_points, tid, tid, loser))
+            await _standingsChanged(c, tid)
+
+
+async def reportBye(player, tid, conn=None):
+    """Assign points for a bye.
+
+    Args:
+        player: id of player who receives a bye
+        tid: the id of the tournament
+        conn: optional connection to run in, see transaction()
+    """
+    async with transaction(conn) as DB:
+        async with DB.cursor() as c:
+            await _lockTournament(c, tid)
+            await c.execute(tournament.ADD_BYE, (player, tid))
+            await c.execute(tournament.OPPONENTS_GAIN, (3, tid, tid, player))
+            await _standingsChanged(c, tid)
+
+
+async def swissPairings(tid, mode=pairing.GREEDY, conn=None):
+    """Returns the pairs of players for the next round.
+
+    Pairs like tournament.swissPairings(), crediting a bye when the field
+    is odd.
+
+    Args:
+        tid: id of tournament
+        mode: pairing.GREEDY or pairing.WEIGHTED
+        conn: optional connection to run in, see transaction()
+
+    Returns a list of (id1, name1, id2, name2) tuples.
+    """
+    async with transaction(conn) as DB:
+        async with DB.cursor() as c:
+            await _lockTournament(c, tid)
+            await c.execute(tournament.PAIRING_SNAPSHOT, (tid, tid))
+            ranks, played, byes = pairing.readSnapshot(await c.fetchall())
+        # Pairing a big field is CPU work; keep it off the event loop.
+        loop = asyncio.get_event_loop()
+        pairs, bye = await loop.run_in_executor(
+            None, pairing.pairRound, ranks, played, byes, mode)
+        if bye is not None:
+            await reportBye(bye[0], tid, DB)
+    return pairs
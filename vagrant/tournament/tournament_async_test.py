@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+#
+# Test cases for tournament_async.py
+
+import asyncio
+
+from tournament import (deleteMatches, deletePlayers, deleteScoreboard,
+                        deleteTournaments)
+from tournament_async import *
+
+
+def reset():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+
+
+async def testRegisterAndReport():
+    reset()
+    tid = await createTournament('Test')
+    id1 = await registerPlayer("Bruno Walton", tid)
+    id2 = await registerPlayer("Boots O'Neal", tid)
+    await reportMatch(tid, id1, id2)
+    standings = await playerStandings(tid)
+    if [row[:4] for row in standings] != [(id1, "Bruno Walton", 3, 1),
+                                          (id2, "Boots O'Neal", 0, 1)]:
+        raise ValueError("Reported matches should show in the standings.")
+    print("1. Players can be registered and matches reported.")
+
+
+async def testPairings():
+    reset()
+    tid = await createTournament('Test')
+    ids = [await registerPlayer(name, tid)
+           for name in ("One", "Two", "Three", "Four", "Five")]
+    await reportMatch(tid, ids[0], ids[1])
+    await reportMatch(tid, ids[2], ids[3])
+    pairings = await swissPairings(tid)
+    paired = set()
+    for (pid1, pname1, pid2, pname2) in pairings:
+        paired.update([pid1, pid2])
+    if len(pairings) != 2 or len(paired) != 4:
+        raise ValueError("For five players, swissPairings should return "
+                         "two pairs.")
+    byes = [row[0] for row in await playerStandings(tid) if row[4] == 1]
+    if len(byes) != 1 or byes[0] in paired:
+        raise ValueError("The unpaired player should be credited a bye.")
+    print("2. Rounds are paired with a bye for the odd player out.")
+
+
+async def testConcurrentRequests():
+    reset()
+    tids = [await createTournament('Test %d' % n) for n in range(4)]
+    await configurePool(maxsize=4)
+    ids = await asyncio.gather(*[registerPlayer("Player %d" % n, tid)
+                                 for tid in tids for n in range(10)])
+    reads = await asyncio.gather(*[playerStandings(tid)
+                                   for tid in tids for n in range(50)])
+    if len(set(ids)) != 40 or any(len(ranks) != 10 for ranks in reads):
+        raise ValueError("Concurrent requests should share the pool.")
+    await closePool()
+    print("3. Hundreds of concurrent requests share a small pool.")
+
+
+async def main():
+    await testRegisterAndReport()
+    await testPairings()
+    await testConcurrentRequests()
+    await closePool()
+    print("Success!  All tests pass!")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
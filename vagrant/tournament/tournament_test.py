@@ -2,6 +2,15 @@
 #
 # Test cases for tournament.py
 
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import tournament
 from tournament import *
 
 def testDeleteMatches():
@@ -155,14 +164,15 @@ def testCheckByes():
     deleteTournaments()
     deleteScoreboard()
     tid = createTournament('Test')
-    registerPlayer("Bruno Walton", tid)
-    registerPlayer("Boots O'Neal", tid)
-    standings = playerStandings(tid)
-    id = standings[-1][0]
-    reportBye(id, tid)
+    [id1, id2] = registerPlayers(["Bruno Walton", "Boots O'Neal"], tid)
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id1, id2)
+    reportBye(id2, tid)
     standings = playerStandings(tid)
+    if standings[-1][0] != id2:
+        raise ValueError("The bye should not lift a player above a winner")
     test = checkByes(tid, standings, -1)
-    if test == -1:
+    if test != -2:
         raise ValueError("This player already has a bye")
     print "10. Byes are assigned properly"
 
@@ -252,6 +262,554 @@ def testRematch():
     print "13. Rematch avoided."
 
 
+def testTransaction():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    with transaction() as conn:
+        registerPlayer("Bruno Walton", tid, conn)
+        registerPlayer("Boots O'Neal", tid, conn)
+        if countPlayers(tid, conn) != 2:
+            raise ValueError(
+                "Batched calls should see each other's uncommitted writes.")
+    try:
+        with transaction() as conn:
+            registerPlayer("Cathy Burton", tid, conn)
+            raise RuntimeError("abort")
+    except RuntimeError:
+        pass
+    if countPlayers(tid) != 2:
+        raise ValueError("A failed transaction should be rolled back.")
+    print "14. Operations can be batched in one pooled transaction."
+
+
+def testPairingBye():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    registerPlayer("One", tid)
+    registerPlayer("Two", tid)
+    registerPlayer("Three", tid)
+    pairings = swissPairings(tid)
+    paired = set()
+    for (pid1, pname1, pid2, pname2) in pairings:
+        paired.update([pid1, pid2])
+    for (i, n, s, m, b, o) in playerStandings(tid):
+        if (i in paired) == (b == 1):
+            raise ValueError(
+                "Only the unpaired player should be credited a bye.")
+        if b == 1 and s != 3:
+            raise ValueError("A bye should be worth three points.")
+    print "15. The unpaired player is credited a bye."
+
+
+def testWeightedPairings():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    registerPlayer("One", tid)
+    registerPlayer("Two", tid)
+    registerPlayer("Three", tid)
+    registerPlayer("Four", tid)
+    registerPlayer("Five", tid)
+    registerPlayer("Six", tid)
+    standings = playerStandings(tid)
+    [id1, id2, id3, id4, id5, id6] = [row[0] for row in standings]
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id3, id4)
+    reportMatch(tid, id5, id6)
+    reportMatch(tid, id1, id3)
+    reportMatch(tid, id5, id2)
+    reportMatch(tid, id4, id6)
+    played = set([frozenset([id1, id2]), frozenset([id3, id4]),
+                  frozenset([id5, id6]), frozenset([id1, id3]),
+                  frozenset([id5, id2]), frozenset([id4, id6])])
+    pairings = swissPairings(tid, pairing.WEIGHTED)
+    if len(pairings) != 3:
+        raise ValueError(
+            "For six players, swissPairings should return three pairs.")
+    for (pid1, pname1, pid2, pname2) in pairings:
+        if frozenset([pid1, pid2]) in played:
+            raise ValueError(
+                "Weighted pairing should avoid the rematch greedy pairing makes.")
+    print "16. Weighted pairing avoids rematches at the bottom of the standings."
+
+
+def testOpponentMatchWins():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    registerPlayer("One", tid)
+    registerPlayer("Two", tid)
+    registerPlayer("Three", tid)
+    registerPlayer("Four", tid)
+    registerPlayer("Five", tid)
+    standings = playerStandings(tid)
+    [id1, id2, id3, id4, id5] = [row[0] for row in standings]
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id3, id4, 'TRUE')
+    reportBye(id5, tid)
+    reportMatch(tid, id1, id3)
+    reportMatch(tid, id5, id2)
+    reportBye(id4, tid)
+    reportMatch(tid, id2, id1)
+    scores = dict((row[0], row[2]) for row in playerStandings(tid))
+    opponents = {id1: [id2, id3], id2: [id1, id5], id3: [id4, id1],
+                 id4: [id3], id5: [id2]}
+    for (i, n, s, m, b, o) in playerStandings(tid):
+        if o != sum(scores[opp] for opp in opponents[i]):
+            raise ValueError(
+                "owm should be the summed score of each distinct opponent.")
+    print "17. Opponent match wins are kept up to date."
+
+
+def testReportRound():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    registerPlayer("Bruno Walton", tid)
+    registerPlayer("Boots O'Neal", tid)
+    registerPlayer("Cathy Burton", tid)
+    registerPlayer("Diane Grant", tid)
+    standings = playerStandings(tid)
+    [id1, id2, id3, id4] = [row[0] for row in standings]
+    reportRound(tid, [(id1, id2, 'FALSE'), (id3, id4, 'TRUE')])
+    reportRound(tid, [(id1, id3, 'FALSE'), (id4, id2, 'FALSE')])
+    expected = {id1: (6, 1), id2: (0, 10), id3: (1, 10), id4: (4, 1)}
+    for (i, n, s, m, b, o) in playerStandings(tid):
+        if m != 2 or (s, o) != expected[i]:
+            raise ValueError(
+                "reportRound should update scores and owm like reportMatch.")
+    other = createTournament('Other')
+    registerPlayer("Melpomene Murray", other)
+    stranger = playerStandings(other)[0][0]
+    try:
+        reportRound(tid, [(id1, id4, 'FALSE'), (id2, stranger, 'FALSE')])
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Unregistered players should fail the whole round.")
+    for (i, n, s, m, b, o) in playerStandings(tid):
+        if m != 2:
+            raise ValueError("A failed round should record no matches.")
+    reportRound(tid, [(id1, id4, True)])
+    reportMatch(tid, id2, id3, True)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT draw FROM matches WHERE tournament = %s "
+                  "ORDER BY matchid", (tid,))
+        if [row[0] for row in c.fetchall()] != [False, True, False, False,
+                                                True, True]:
+            raise ValueError("Booleans and 'TRUE' should both mark draws.")
+    try:
+        reportMatch(tid, id1, id2, 'yes')
+    except ValueError:
+        pass
+    else:
+        raise ValueError("Anything else should be refused as a draw flag.")
+    print "18. A whole round can be reported at once."
+
+
+def testRegisterPlayers():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    names = ["Player %d" % n for n in range(2500)]
+    ids = registerPlayers(names, tid)
+    if countPlayers(tid) != 2500 or len(set(ids)) != 2500:
+        raise ValueError("registerPlayers should register every name once.")
+    registered = dict((row[0], row[1]) for row in playerStandings(tid))
+    if [registered[i] for i in ids] != names:
+        raise ValueError("registerPlayers should return ids in name order.")
+    roster = tempfile.NamedTemporaryFile(suffix='.csv', delete=False)
+    roster.write('name\nTwilight Sparkle\n\n"Fluttershy, Esq."\n')
+    roster.close()
+    try:
+        ids = importPlayers(roster.name, tid)
+    finally:
+        os.remove(roster.name)
+    registered = dict((row[0], row[1]) for row in playerStandings(tid))
+    if [registered[i] for i in ids] != ["Twilight Sparkle", "Fluttershy, Esq."]:
+        raise ValueError("importPlayers should register each CSV row.")
+    print "19. Players can be registered in bulk."
+
+
+def waitFor(check, timeout=10):
+    """Polls check() until it returns true or timeout seconds pass."""
+    deadline = time.time() + timeout
+    while not check():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def reportElsewhere(tid, winner, loser):
+    """Reports a match from another process, as another web worker would."""
+    code = ("import tournament\n"
+            "tournament.STANDINGS_NOTIFY = %r\n"
+            "tournament.reportMatch(%d, %d, %d)\n"
+            % (tournament.STANDINGS_NOTIFY, tid, winner, loser))
+    subprocess.check_call([sys.executable, '-c', code],
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def testStandingsCache():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    registerPlayer("Bruno Walton", tid)
+    registerPlayer("Boots O'Neal", tid)
+    [id1, id2] = [row[0] for row in playerStandings(tid)]
+    reportElsewhere(tid, id1, id2)
+    if playerStandings(tid)[0][:3] != (id1, "Bruno Walton", 3):
+        raise ValueError("Without a listener, standings should not be cached.")
+    tournament.STANDINGS_NOTIFY = True
+    listenForStandings()
+    try:
+        if not standingsListening(10):
+            raise ValueError("The standings listener should start.")
+        if playerStandings(tid) != playerStandings(tid):
+            raise ValueError("Repeated standings reads should agree.")
+        reportMatch(tid, id1, id2)
+        if playerStandings(tid)[0][:3] != (id1, "Bruno Walton", 6):
+            raise ValueError("Reporting a match should invalidate standings.")
+        with transaction() as conn:
+            reportBye(id2, tid, conn)
+            playerStandings(tid)
+        if playerStandings(tid)[1][2] != 3:
+            raise ValueError(
+                "Standings read mid-transaction should not linger.")
+        DB = connect()
+        reportMatch(tid, id2, id1, 'FALSE', DB)
+        playerStandings(tid)
+        DB.commit()
+        if playerStandings(tid)[1][:3] != (id2, "Boots O'Neal", 6):
+            raise ValueError("A caller's commit should invalidate standings.")
+        if tournament._pending:
+            raise ValueError("Ended transactions should be forgotten.")
+        c = DB.cursor()
+        c.execute("UPDATE scoreboard SET score = 10 WHERE player = %s", (id2,))
+        DB.commit()
+        if playerStandings(tid)[0][0] != id1:
+            raise ValueError("Unannounced writes should not reach the cache.")
+        c.execute("SELECT pg_notify(%s, %s)", (STANDINGS_CHANNEL, str(tid)))
+        DB.commit()
+        DB.close()
+        if not waitFor(lambda: playerStandings(tid)[0][0] == id2):
+            raise ValueError("A NOTIFY should invalidate cached standings.")
+        reportElsewhere(tid, id1, id2)
+        if not waitFor(lambda: playerStandings(tid)[1][:3] ==
+                       (id1, "Bruno Walton", 9)):
+            raise ValueError("Writes from other processes should be heard.")
+    finally:
+        stopListening()
+        tournament.STANDINGS_NOTIFY = False
+    if standingsListening(0):
+        raise ValueError("The standings listener should stop.")
+    print "20. Standings are cached until they change."
+
+
+def testConcurrentReports():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    work = []
+    for name in ('First', 'Second'):
+        tid = createTournament(name)
+        ids = registerPlayers(["Player %d" % n for n in range(8)], tid)
+        for offset in (1, 2, 3):
+            for n in range(0, 8, 2):
+                work.append((tid, ids[n], ids[(n + offset * 2 + 1) % 8]))
+    errors = []
+    def report(chunk):
+        try:
+            for (tid, winner, loser) in chunk:
+                reportMatch(tid, winner, loser)
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=report, args=(work[n::6],))
+               for n in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    for tid in set(row[0] for row in work):
+        before = playerStandings(tid)
+        refreshOpponentMatchWins(tid)
+        if sorted(before) != sorted(playerStandings(tid)):
+            raise ValueError(
+                "Concurrent reports should leave consistent standings.")
+    print "21. Matches can be reported concurrently."
+
+
+def testPairingSnapshot():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    registerPlayers(["One", "Two", "Three", "Four", "Five"], tid)
+    [id1, id2, id3, id4, id5] = [row[0] for row in playerStandings(tid)]
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id3, id4)
+    reportBye(id5, tid)
+    reportMatch(tid, id2, id1)
+    ranks, played, byes = pairingSnapshot(tid)
+    if ranks != playerStandings(tid):
+        raise ValueError("The snapshot should carry the current standings.")
+    if played != set([frozenset([id1, id2]), frozenset([id3, id4])]):
+        raise ValueError("The snapshot should list every pair that has met.")
+    if byes != set([id5]):
+        raise ValueError("The snapshot should list the players with a bye.")
+    print "22. A pairing snapshot is read in one query."
+
+
+def testPreparedStatements():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    [id1, id2, id3, id4] = registerPlayers(["One", "Two", "Three", "Four"], tid)
+    with transaction() as conn:
+        reportMatch(tid, id1, id2, 'FALSE', conn)
+        c = conn.cursor()
+        c.execute("""SELECT count(*) FROM pg_prepared_statements
+                     WHERE name = 'tournament_add_score'""")
+        if c.fetchone()[0] != 1:
+            raise ValueError("Hot statements should be prepared.")
+    tournament.PREPARED_STATEMENTS = False
+    try:
+        reportMatch(tid, id3, id4, 'TRUE')
+    finally:
+        tournament.PREPARED_STATEMENTS = True
+    scores = dict((row[0], row[2]) for row in playerStandings(tid))
+    if scores != {id1: 3, id2: 0, id3: 1, id4: 1}:
+        raise ValueError(
+            "Prepared and plain statements should record the same results.")
+    print "23. Hot statements run as prepared statements."
+
+
+def testRoundHistory():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    [id1, id2, id3, id4] = registerPlayers(["One", "Two", "Three", "Four"], tid)
+    if currentRound(tid) != 1:
+        raise ValueError("A new tournament should be in round 1.")
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id3, id4)
+    after1 = playerStandings(tid)
+    if closeRound(tid) != 1 or currentRound(tid) != 2:
+        raise ValueError("Closing round 1 should start round 2.")
+    reportRound(tid, [(id1, id3, 'FALSE'), (id2, id4, 'TRUE')])
+    closeRound(tid)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT round, count(*) FROM matches WHERE tournament = %s
+                     GROUP BY round ORDER BY round""", (tid,))
+        if c.fetchall() != [(1, 2), (2, 2)]:
+            raise ValueError("Matches should record the round they were in.")
+    if standingsAfterRound(tid, 1) != after1:
+        raise ValueError(
+            "Standings after round 1 should match those seen at the time.")
+    if standingsAfterRound(tid, 2) != playerStandings(tid):
+        raise ValueError(
+            "Standings after the last round should match the current ones.")
+    if [row[:3] for row in playerHistory(tid, id1)] != [(1, 1, 3), (2, 1, 6)]:
+        raise ValueError("Player history should list every closed round.")
+    if playerHistory(tid, id4)[1][2] != 1:
+        raise ValueError("A drawn match should give both players a point.")
+    print "24. Standings are recorded as each round closes."
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def testInstrumentation():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    [id1, id2, id3] = registerPlayers(["One", "Two", "Three"], tid)
+    resetMetrics()
+    reportMatch(tid, id1, id2)
+    if metrics():
+        raise ValueError("Nothing should be counted while instrumentation is off.")
+    handler = ListHandler()
+    tournament.log.addHandler(handler)
+    tournament.INSTRUMENT = True
+    tournament.SLOW_QUERY = 0
+    try:
+        reportMatch(tid, id3, id1)
+        swissPairings(tid)
+    finally:
+        tournament.INSTRUMENT = False
+        tournament.SLOW_QUERY = None
+        tournament.log.removeHandler(handler)
+    counts = metrics()
+    if sorted(counts) != ['reportMatch', 'swissPairings']:
+        raise ValueError("Nested calls should be charged to the outer call.")
+    report = counts['reportMatch']
+    if report['calls'] != 1 or report['queries'] != 8:
+        raise ValueError("A first meeting should take eight queries.")
+    if report['roundTrips'] <= report['queries'] or report['rows'] < 6:
+        raise ValueError("Commits should count as round trips, and rows too.")
+    if not 0 < report['dbSeconds'] <= report['seconds']:
+        raise ValueError("Time waiting on the server is part of the call.")
+    if not [r for r in handler.records if 'swissPairings' in r.getMessage()]:
+        raise ValueError("Statements over the threshold should be logged.")
+    resetMetrics()
+    if metrics():
+        raise ValueError("resetMetrics() should clear the counts.")
+    print "25. Queries are counted per public function."
+
+
+def testIterativeSearch():
+    deleteMatches()
+    deletePlayers()
+    deleteTournaments()
+    deleteScoreboard()
+    tid = createTournament('Test')
+    [id1, id2, id3, id4] = registerPlayers(["One", "Two", "Three", "Four"], tid)
+    reportMatch(tid, id1, id2)
+    reportMatch(tid, id1, id3)
+    standings = playerStandings(tid)
+    if checkPairs(tid, standings, 0, 1) != 3:
+        raise ValueError("The first player not met yet should be found.")
+    ranks, played, byes = pairingSnapshot(tid)
+    resetMetrics()
+    tournament.INSTRUMENT = True
+    try:
+        found = [checkPairs(tid, ranks, 0, 1, played) for n in range(3)]
+    finally:
+        tournament.INSTRUMENT = False
+    if found != [3, 3, 3] or metrics()['checkPairs']['queries'] != 0:
+        raise ValueError("Preloaded history should need no queries.")
+    resetMetrics()
+    # Fields far deeper than the recursion limit.
+    size = 20000
+    ranks = [(n, 'P', 0, 0, 1, 0) for n in range(size)]
+    ranks[0] = (0, 'P', 0, 0, 0, 0)
+    if checkByes(tid, ranks, -1) != -size:
+        raise ValueError("The only player without a bye should get it.")
+    played = set(frozenset((0, n)) for n in range(1, size - 1))
+    if pairing.pickOpponent(ranks, played) != size - 1:
+        raise ValueError("The only player not met yet should be found.")
+    played = set(frozenset((n, n + 1)) for n in range(0, size, 2))
+    pairs = pairing.greedyPairs(ranks, played)
+    if len(pairs) != size // 2 or any(
+            frozenset((p[0], p[2])) in played for p in pairs):
+        raise ValueError("Greedy pairing should avoid every rematch here.")
+    print "26. Byes and opponents are searched without recursion."
+
+
+def testArchive():
+    resetDatabase(archives=True)
+    tid1 = createTournament('Finished')
+    tid2 = createTournament('Running')
+    [id1, id2, id5] = registerPlayers(["One", "Two", "Five"], tid1)
+    [id3, id4] = registerPlayers(["Three", "Four"], tid2)
+    reportMatch(tid1, id1, id2)
+    closeRound(tid1)
+    reportMatch(tid2, id3, id4)
+    archiveTournament(tid1)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT DISTINCT tournament FROM matches")
+        if c.fetchall() != [(tid2,)] or countPlayers(tid2, conn) != 2:
+            raise ValueError("Archiving should leave other tournaments be.")
+        c.execute("SELECT id FROM players ORDER BY id")
+        if c.fetchall() != [(id1,), (id2,), (id3,), (id4,)]:
+            raise ValueError(
+                "Only players who played a closed round should be kept.")
+        c.execute("SELECT id, name, rounds FROM tournaments_archive")
+        if c.fetchall() != [(tid1, 'Finished', 1)]:
+            raise ValueError("The tournament should be archived.")
+        c.execute("SELECT winner, loser, round FROM matches_archive")
+        if c.fetchall() != [(id1, id2, 1)]:
+            raise ValueError("Its matches should be archived.")
+        c.execute("""SELECT player, name, score FROM scoreboard_archive
+                     ORDER BY score DESC, player""")
+        if c.fetchall() != [(id1, "One", 3), (id2, "Two", 0),
+                            (id5, "Five", 0)]:
+            raise ValueError("Its scoreboard should be archived with names.")
+        c.execute("SELECT count(*) FROM standings_history_archive")
+        if c.fetchone()[0] != 3:
+            raise ValueError("Its standings history should be archived.")
+    deleteTournament(tid2)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("""SELECT (SELECT count(*) FROM players),
+                            (SELECT count(*) FROM tournaments),
+                            (SELECT count(*) FROM matches_archive)""")
+        if c.fetchone() != (2, 0, 1):
+            raise ValueError("Deleting should remove only the tournament.")
+    resetDatabase(archives=True)
+    with transaction() as conn:
+        c = conn.cursor()
+        c.execute("SELECT count(*) FROM tournaments_archive")
+        if c.fetchone()[0] != 0:
+            raise ValueError("A full reset should empty the archives too.")
+    print "27. Tournaments are archived and deleted one at a time."
+
+
+def testPoolWaits():
+    resetDatabase()
+    work = []
+    for n in range(16):
+        tid = createTournament('Tournament %d' % n)
+        work.append((tid, registerPlayers(["One", "Two"], tid)))
+    errors = []
+    def report(tid, ids):
+        try:
+            reportMatch(tid, ids[0], ids[1])
+        except Exception as e:
+            errors.append(e)
+    configurePool(maxconn=2)
+    try:
+        threads = [threading.Thread(target=report, args=job) for job in work]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        configurePool()
+    if errors:
+        raise errors[0]
+    for (tid, ids) in work:
+        if playerStandings(tid)[0][:3] != (ids[0], "One", 3):
+            raise ValueError("Every waiting report should be recorded.")
+    print "28. Transactions wait for a free pooled connection."
+
+
 if __name__ == '__main__':
     testDeleteMatches()
     testDelete()
@@ -261,9 +819,24 @@ if __name__ == '__main__':
     testStandingsBeforeMatches()
     testReportMatches()
     testReportBye()
-    testHasBye
+    testHasBye()
     testCheckByes()
     testPairings()
     testOddPairings()
     testRematch()
+    testTransaction()
+    testPairingBye()
+    testWeightedPairings()
+    testOpponentMatchWins()
+    testReportRound()
+    testRegisterPlayers()
+    testStandingsCache()
+    testConcurrentReports()
+    testPairingSnapshot()
+    testPreparedStatements()
+    testRoundHistory()
+    testInstrumentation()
+    testIterativeSearch()
+    testArchive()
+    testPoolWaits()
     print "Success!  All tests pass!"